@@ -0,0 +1,419 @@
+"""
+Модуль `benchmark.py` содержит воспроизводимый нагрузочный тест HTTP API приложения.
+
+Основные функции:
+- `run_benchmark(options)`: Выполняет все этапы теста и возвращает результаты.
+- `compare_results(current, baseline, tolerance)`: Сравнивает результаты с предыдущим запуском.
+
+Описание:
+    Тест запускает `uvicorn main:app` в отдельном процессе с временной базой данных и
+    подменяет Twilio локальным тестовым сервером (через `TWILIO_API_URL`), который
+    принимает сообщения с настраиваемой задержкой и долей ошибок. Перед запуском база
+    заполняется `--db-size` напоминаниями в далеком будущем.
+
+    Этапы теста с параллелизмом `--concurrency`:
+    - `create`: `POST /reminder/`;
+    - `list`: `GET /reminders/`;
+    - `get`: `GET /reminder/{id}`;
+    - `delete`: `DELETE /reminder/{id}`;
+    - `dispatch`: создание `--dispatch-count` напоминаний на ближайшие секунды и измерение
+      задержки доставки - разницы между временем напоминания и получением сообщения
+      тестовым сервером Twilio.
+
+    Для каждого этапа вычисляются пропускная способность и задержки p50/p95/p99.
+    Результаты сохраняются в JSON (`--output`); с флагом `--compare` результаты
+    сравниваются с сохраненным ранее файлом, и при ухудшении p95 или пропускной
+    способности больше допуска процесс завершается с кодом 1.
+
+Пример использования:
+    >>> python benchmark.py --requests 2000 --concurrency 50 --db-size 100000 --output bench.json
+    >>> python benchmark.py --output new.json --compare bench.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from database import TIME_FORMAT, create_database, save_reminders
+
+# Каталог с исходным кодом приложения
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, fraction):
+    """
+    Возвращает перцентиль по методу ближайшего ранга.
+
+    Параметры:
+        values (list): Отсортированные значения.
+        fraction (float): Доля от 0 до 1.
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Сводит задержки этапа в пропускную способность и перцентили (в миллисекундах).
+    """
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def free_port():
+    """
+    Возвращает свободный TCP-порт на localhost.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeTwilio:
+    """
+    Локальный тестовый сервер, принимающий запросы отправки сообщений Twilio.
+
+    Атрибуты:
+        latency (float): Задержка ответа в секундах.
+        error_rate (float): Доля ответов 500.
+        received (list): Пары `(время получения, текст сообщения)`.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.received = []
+        self._runner = None
+
+    async def _handle(self, request):
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return web.json_response({"message": "fake error"}, status=500)
+        self.received.append((time.time(), form.get("Body", "")))
+        return web.json_response({"sid": f"SM{len(self.received)}", "status": "queued"}, status=201)
+
+    async def start(self, port):
+        """
+        Запускает сервер на указанном порту.
+        """
+        app = web.Application()
+        app.router.add_post("/2010-04-01/Accounts/{sid}/Messages.json", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        """
+        Останавливает сервер.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def seed_database(path, size, phones):
+    """
+    Заполняет базу напоминаниями в далеком будущем, равномерно по номерам телефонов.
+
+    Возвращает:
+        list: Номера телефонов, использованные при заполнении.
+    """
+    conn = create_database(path)
+    numbers = [f"+7900{index:07d}" for index in range(phones)]
+    due = datetime.datetime(2099, 1, 1)
+    chunk = []
+    for index in range(size):
+        reminder_time = due + datetime.timedelta(seconds=index)
+        chunk.append({
+            "phone_number": numbers[index % phones],
+            "reminder_text": f"seed {index}",
+            "reminder_time": reminder_time.strftime(TIME_FORMAT),
+            "due_at": int(reminder_time.timestamp()),
+        })
+        if len(chunk) == 10000:
+            save_reminders(conn, chunk)
+            chunk = []
+    save_reminders(conn, chunk)
+    conn.close()
+    return numbers
+
+
+async def run_phase(session, concurrency, requests):
+    """
+    Выполняет запросы этапа с ограниченным параллелизмом.
+
+    Параметры:
+        session (aiohttp.ClientSession): HTTP-сессия.
+        concurrency (int): Максимальное количество одновременных запросов.
+        requests (list): Корутинные фабрики `make(session)`, возвращающие aiohttp-ответ.
+
+    Возвращает:
+        dict: Сводка этапа (`summarize`) и список JSON-ответов.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    bodies = []
+
+    async def one(make):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with make(session) as response:
+                    body = await response.json()
+                    if response.status >= 400:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - started)
+                    bodies.append(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(make) for make in requests))
+    return summarize(latencies, errors, time.perf_counter() - started), bodies
+
+
+async def wait_ready(base_url, timeout=30.0):
+    """
+    Ожидает, пока приложение начнет отвечать на запросы.
+    """
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/reminders/", params={"phone_number": "+0", "limit": "1"}):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("Приложение не запустилось")
+
+
+async def run_benchmark(options):
+    """
+    Выполняет все этапы нагрузочного теста во временном каталоге, который удаляется после теста.
+
+    Параметры:
+        options (argparse.Namespace): Параметры запуска.
+
+    Возвращает:
+        dict: Результаты теста.
+    """
+    with tempfile.TemporaryDirectory(prefix="reminders-bench-") as workdir:
+        return await run_phases(options, workdir)
+
+
+async def run_phases(options, workdir):
+    """
+    Заполняет базу в каталоге `workdir`, запускает приложение и выполняет этапы теста.
+    """
+    db_path = os.path.join(workdir, "bench.db")
+    phones = seed_database(db_path, options.db_size, options.phones)
+
+    twilio = FakeTwilio(options.twilio_latency, options.twilio_error_rate)
+    twilio_port = free_port()
+    await twilio.start(twilio_port)
+
+    app_port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_PATH": db_path,
+        "TWILIO_API_URL": f"http://127.0.0.1:{twilio_port}",
+        "ACCOUNT_SID": "ACbenchmark",
+        "AUTH_TOKEN": "benchmark",
+        "FROM_NUMBER": "+10000000000",
+    }
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", APP_DIR,
+               "--port", str(app_port), "--log-level", "warning", "--workers", str(options.workers)]
+    server = subprocess.Popen(command, cwd=workdir, env=env)
+    base_url = f"http://127.0.0.1:{app_port}"
+    results = {"config": vars(options), "phases": {}}
+    try:
+        await wait_ready(base_url)
+        async with aiohttp.ClientSession(base_url=base_url) as session:
+            future = (datetime.datetime.now() + datetime.timedelta(days=365)).strftime(TIME_FORMAT)
+
+            def create(index):
+                body = {"phone_number": random.choice(phones), "reminder_text": f"bench {index}",
+                        "reminder_time": future}
+                return lambda s: s.post("/reminder/", json=body)
+
+            summary, _ = await run_phase(session, options.concurrency,
+                                         [create(index) for index in range(options.requests)])
+            results["phases"]["create"] = summary
+
+            def list_page(phone):
+                return lambda s: s.get("/reminders/", params={"phone_number": phone, "limit": "100"})
+
+            summary, pages = await run_phase(session, options.concurrency,
+                                             [list_page(random.choice(phones)) for _ in range(options.requests)])
+            results["phases"]["list"] = summary
+
+            known = [(r["id"], r["phone_number"]) for page in pages for r in page["reminders"]]
+            sample = random.sample(known, min(len(known), options.requests))
+
+            def get_one(reminder_id, phone):
+                return lambda s: s.get(f"/reminder/{reminder_id}", params={"phone_number": phone})
+
+            summary, _ = await run_phase(session, options.concurrency,
+                                         [get_one(reminder_id, phone) for reminder_id, phone in sample])
+            results["phases"]["get"] = summary
+
+            def delete_one(reminder_id):
+                return lambda s: s.delete(f"/reminder/{reminder_id}")
+
+            deleted = list({reminder_id for reminder_id, _ in sample})
+            summary, _ = await run_phase(session, options.concurrency,
+                                         [delete_one(reminder_id) for reminder_id in deleted])
+            results["phases"]["delete"] = summary
+
+            results["dispatch"] = await measure_dispatch(session, twilio, options, phones)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        await twilio.stop()
+    return results
+
+
+async def measure_dispatch(session, twilio, options, phones):
+    """
+    Создает напоминания на ближайшие секунды и измеряет задержку их доставки.
+
+    Возвращает:
+        dict: Количество доставленных, повторных и потерянных сообщений и перцентили задержки.
+    """
+    due = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(seconds=options.dispatch_delay)
+    due_epoch = due.timestamp()
+    tag = f"dispatch-{int(due_epoch)}"
+
+    def create(index):
+        body = {"phone_number": random.choice(phones), "reminder_text": f"{tag} {index}",
+                "reminder_time": due.strftime(TIME_FORMAT)}
+        return lambda s: s.post("/reminder/", json=body)
+
+    await run_phase(session, options.concurrency, [create(index) for index in range(options.dispatch_count)])
+
+    deadline = due_epoch + options.dispatch_timeout
+    while time.time() < deadline:
+        if sum(1 for _, body in twilio.received if body.startswith(tag)) >= options.dispatch_count:
+            break
+        await asyncio.sleep(0.2)
+
+    seen = {}
+    for received_at, body in twilio.received:
+        if body.startswith(tag):
+            seen.setdefault(body, []).append(received_at)
+    lags = sorted(min(times) - due_epoch for times in seen.values())
+    first, last = (min(min(t) for t in seen.values()), max(min(t) for t in seen.values())) if seen else (0, 0)
+    return {
+        "scheduled": options.dispatch_count,
+        "delivered": len(seen),
+        "duplicates": sum(len(times) - 1 for times in seen.values()),
+        "missing": options.dispatch_count - len(seen),
+        "sends_per_s": round(len(seen) / (last - first), 1) if last > first else None,
+        "lag_p50_ms": round(percentile(lags, 0.50) * 1000, 1) if lags else None,
+        "lag_p95_ms": round(percentile(lags, 0.95) * 1000, 1) if lags else None,
+        "lag_p99_ms": round(percentile(lags, 0.99) * 1000, 1) if lags else None,
+        "lag_max_ms": round(lags[-1] * 1000, 1) if lags else None,
+    }
+
+
+def compare_results(current, baseline, tolerance):
+    """
+    Сравнивает результаты с предыдущим запуском.
+
+    Параметры:
+        current (dict): Результаты текущего запуска.
+        baseline (dict): Результаты предыдущего запуска.
+        tolerance (float): Допустимое относительное ухудшение (например, 0.1 - 10%).
+
+    Возвращает:
+        list: Описания регрессий.
+    """
+    regressions = []
+    for phase, summary in current["phases"].items():
+        before = baseline.get("phases", {}).get(phase)
+        if not before:
+            continue
+        if before.get("p95_ms") and summary.get("p95_ms") and summary["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{phase}: p95 {before['p95_ms']} -> {summary['p95_ms']} мс")
+        if (before.get("throughput_rps") and summary.get("throughput_rps")
+                and summary["throughput_rps"] < before["throughput_rps"] * (1 - tolerance)):
+            regressions.append(f"{phase}: throughput {before['throughput_rps']} -> {summary['throughput_rps']} rps")
+    lag_before = baseline.get("dispatch", {}).get("lag_p95_ms")
+    lag_now = current.get("dispatch", {}).get("lag_p95_ms")
+    if lag_before and lag_now and lag_now > lag_before * (1 + tolerance):
+        regressions.append(f"dispatch: lag p95 {lag_before} -> {lag_now} мс")
+    if current.get("dispatch", {}).get("duplicates"):
+        regressions.append(f"dispatch: повторных отправок {current['dispatch']['duplicates']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    """
+    Разбирает параметры командной строки.
+    """
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API напоминаний")
+    parser.add_argument("--requests", type=int, default=1000, help="Количество запросов на этап")
+    parser.add_argument("--concurrency", type=int, default=50, help="Количество одновременных запросов")
+    parser.add_argument("--db-size", type=int, default=10000, help="Количество напоминаний в базе перед тестом")
+    parser.add_argument("--phones", type=int, default=100, help="Количество номеров телефонов в базе")
+    parser.add_argument("--workers", type=int, default=1, help="Количество процессов uvicorn")
+    parser.add_argument("--dispatch-count", type=int, default=500, help="Количество напоминаний для замера доставки")
+    parser.add_argument("--dispatch-delay", type=int, default=5, help="Через сколько секунд наступают напоминания")
+    parser.add_argument("--dispatch-timeout", type=float, default=60, help="Сколько секунд ждать доставки")
+    parser.add_argument("--twilio-latency", type=float, default=0.0, help="Задержка ответа тестового Twilio (с)")
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0, help="Доля ответов 500 тестового Twilio")
+    parser.add_argument("--seed", type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--output", default="bench_results.json", help="Файл для сохранения результатов")
+    parser.add_argument("--compare", help="Файл результатов предыдущего запуска для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимое относительное ухудшение")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Точка входа: выполняет тест, сохраняет результаты и сравнивает их с предыдущим запуском.
+    """
+    options = parse_args(argv)
+    random.seed(options.seed)
+    results = asyncio.run(run_benchmark(options))
+    with open(options.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as file:
+            regressions = compare_results(results, json.load(file), options.tolerance)
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Модуль `bulk_import.py` предназначен для потокового разбора массовой загрузки напоминаний.
+
+Основные функции:
+- `validate_reminder(data)`: Проверяет данные одного напоминания и приводит время к единому формату.
+- `iter_records(chunks, content_type)`: Построчно разбирает поток NDJSON или CSV.
+
+Описание:
+    Тело запроса читается частями и разбирается по мере поступления, поэтому загрузка
+    целиком в память не попадает. Поддерживаются два формата:
+    - NDJSON (`application/x-ndjson`): один JSON-объект напоминания на строку;
+    - CSV (`text/csv`): первая строка - заголовок с колонками `phone_number`,
+      `reminder_text`, `reminder_time` и необязательными `repeat_cron`, `repeat_every`,
+      `repeat_until`, `params` (JSON-объект параметров шаблона). Поле в кавычках может
+      содержать переводы строк, тогда запись занимает несколько строк.
+
+    Для каждой записи возвращается либо проверенное напоминание, либо текст ошибки,
+    чтобы ошибочные записи не прерывали загрузку всей пачки. Ошибка указывает номер
+    первой строки записи.
+
+Пример использования:
+    >>> async for line, reminder, error in iter_records(request.stream(), "application/x-ndjson"):
+    ...     print(line, reminder, error)
+"""
+
+import codecs
+import csv
+import datetime
+import json
+
+from pydantic import ValidationError
+
+from database import TIME_FORMAT, format_timestamp
+from models import Reminder
+from recurrence import first_fire_time
+
+# Поддерживаемые типы содержимого
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+
+# Максимальная длина записи CSV; ограничивает память при незакрытых кавычках
+MAX_CSV_RECORD_LENGTH = 65536
+
+def validate_reminder(data):
+    """
+    Проверяет данные одного напоминания и приводит время к единому формату.
+
+    Параметры:
+        data (dict): Данные напоминания.
+
+    Возвращает:
+        dict: Напоминание с полями `phone_number`, `reminder_text`, `reminder_time`, `due_at`
+            правилом повторения `repeat_cron`, `repeat_every`, `repeat_until` и параметрами шаблона `params`.
+
+    Исключения:
+        ValueError: Если данные не соответствуют модели `Reminder` или время указано в неверном формате.
+    """
+    try:
+        reminder = Reminder.model_validate(data)
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        raise ValueError(errors) from e
+    try:
+        reminder_time = datetime.datetime.strptime(reminder.reminder_time, TIME_FORMAT)
+    except ValueError as e:
+        raise ValueError("Некорректный формат времени. Используйте формат 'YYYY-MM-DD HH:MM:SS'.") from e
+    due_at = first_fire_time(int(reminder_time.timestamp()), reminder.repeat_cron)
+    result = reminder.model_dump()
+    result["reminder_time"] = format_timestamp(due_at)
+    result["due_at"] = due_at
+    return result
+
+async def _iter_lines(chunks):
+    """
+    Превращает асинхронный поток байтов в поток строк без завершающих переводов строки.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def _enumerate_lines(lines):
+    """
+    Нумерует строки потока, начиная с единицы.
+    """
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        yield line_number, line
+
+async def _iter_csv_records(lines):
+    """
+    Объединяет строки CSV в записи: строка с незакрытыми кавычками продолжается следующей.
+
+    Возвращает:
+        Асинхронный генератор пар `(line, record)`, где `line` - номер первой строки записи.
+    """
+    parts = []
+    quotes = length = first_line = 0
+    async for line_number, line in _enumerate_lines(lines):
+        if not parts:
+            first_line = line_number
+        parts.append(line)
+        # Экранированная кавычка `""` не меняет четность, поэтому нечетное число кавычек означает открытое поле
+        quotes += line.count('"')
+        length += len(line) + 1
+        if quotes % 2 and length <= MAX_CSV_RECORD_LENGTH:
+            continue
+        yield first_line, "\n".join(parts)
+        parts = []
+        quotes = length = 0
+    if parts:
+        yield first_line, "\n".join(parts)
+
+async def iter_records(chunks, content_type):
+    """
+    Разбирает поток NDJSON или CSV по записям и проверяет каждую запись.
+
+    Параметры:
+        chunks: Асинхронный итератор частей тела запроса (bytes).
+        content_type (str): Тип содержимого запроса.
+
+    Возвращает:
+        Асинхронный генератор кортежей `(line, reminder, error)`, где `line` - номер (первой) строки записи,
+        `reminder` - проверенное напоминание или None, `error` - текст ошибки или None.
+    """
+    is_csv = content_type.split(";")[0].strip().lower() in CSV_CONTENT_TYPES
+    header = None
+    lines = _iter_lines(chunks)
+    async for line_number, line in (_iter_csv_records(lines) if is_csv else _enumerate_lines(lines)):
+        if not line.strip():
+            continue
+        try:
+            if is_csv:
+                if line.count('"') % 2:
+                    raise ValueError("Незакрытые кавычки в записи CSV")
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [value.strip() for value in values]
+                    continue
+                if len(values) != len(header):
+                    raise ValueError(f"Ожидалось {len(header)} колонок, получено {len(values)}")
+                data = dict(zip(header, values))
+            else:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("Строка должна содержать JSON-объект")
+            yield line_number, validate_reminder(data), None
+        except ValueError as e:
+            yield line_number, None, str(e)
@@ -0,0 +1,288 @@
+"""
+Модуль `cache.py` реализует кэш чтения для запросов напоминаний.
+
+Основные классы:
+- `LRUCache`: Ограниченный кэш в памяти процесса с вытеснением LRU и временем жизни записей.
+- `RedisCache`: Кэш на Redis-совместимом сервере для нескольких реплик приложения.
+- `ReminderCache`: Кэш напоминаний по ID и страниц списков по номеру телефона.
+
+Основные функции:
+- `create_cache(backend, url, max_entries, ttl)`: Создает `ReminderCache` с выбранным хранилищем.
+
+Описание:
+    Хранилище кэша подключаемое: любой объект с методами `get(key)`, `set(key, value)`,
+    `delete(*keys)` и `stats()` может использоваться вместо `LRUCache`. Попадания и промахи
+    считает `ReminderCache` только для записей напоминаний и страниц, поэтому чтение ключей
+    версий не искажает долю попаданий.
+
+    Методы `ReminderCache` - корутины. Хранилище с пулом потоков `executor` (`RedisCache`)
+    вызывается в этом пуле, поэтому сетевые запросы к серверу кэша не блокируют цикл
+    событий API и конвейера доставки; `LRUCache` вызывается непосредственно.
+
+    Списки напоминаний кэшируются с учетом версии номера телефона. При сохранении или
+    удалении напоминания версия номера меняется, и все закэшированные страницы этого номера
+    перестают использоваться, не затрагивая другие номера. Запись напоминания по ID
+    версионируется так же, но отдельно для каждого ID.
+
+    Чтение из кэша возвращает версию, которую нужно передать в `set_reminder` или
+    `set_listing` после запроса к базе. Если во время запроса напоминание изменили или
+    удалили, версия уже сменилась, и устаревший результат сохраняется под старой версией,
+    которую больше никто не читает.
+
+Пример использования:
+    >>> cache = create_cache("memory", max_entries=10000, ttl=30)
+    >>> reminder, version = await cache.get_reminder(1)
+    >>> await cache.set_reminder({"id": 1, "phone_number": "+79123456789", "reminder_text": "Позвонить маме",
+    ...                     "reminder_time": "2023-10-01 12:00:00"}, version)
+    >>> await cache.invalidate(reminder_id=1, phone_number="+79123456789")
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - Redis нужен только для общего кэша нескольких реплик
+    redis = None
+
+
+class LRUCache:
+    """
+    Потокобезопасный кэш в памяти с вытеснением давно не использованных записей.
+
+    Атрибуты:
+        max_entries (int): Максимальное количество записей.
+        ttl (float): Время жизни записи в секундах.
+        clock (callable): Источник монотонного времени.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Возвращает значение по ключу или None, если записи нет или она устарела.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < self.clock():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        """
+        Сохраняет значение по ключу, вытесняя самые старые записи при переполнении.
+        """
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        """
+        Удаляет записи по ключам.
+        """
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def stats(self):
+        """
+        Возвращает счетчики попаданий, промахов и вытеснений.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._data)}
+
+
+class RedisCache:
+    """
+    Кэш на Redis-совместимом сервере; значения хранятся в JSON.
+
+    Атрибуты:
+        url (str): Адрес сервера, например `redis://localhost:6379/0`.
+        ttl (float): Время жизни записи в секундах.
+        prefix (str): Префикс ключей.
+        executor (ThreadPoolExecutor): Пул потоков для синхронных запросов к серверу.
+    """
+
+    def __init__(self, url, ttl=30.0, prefix="reminders:", max_workers=8):
+        if redis is None:
+            raise RuntimeError("Для CACHE_BACKEND=redis необходимо установить пакет redis")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, max_connections=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reminder-cache")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Возвращает значение по ключу или None.
+        """
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        """
+        Сохраняет значение по ключу со временем жизни `ttl`.
+        """
+        self._client.set(self.prefix + key, json.dumps(value), px=int(self.ttl * 1000))
+
+    def delete(self, *keys):
+        """
+        Удаляет записи по ключам.
+        """
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def stats(self):
+        """
+        Возвращает счетчики попаданий и промахов этого процесса.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ReminderCache:
+    """
+    Кэш напоминаний по ID и страниц списков напоминаний по номеру телефона.
+
+    Атрибуты:
+        backend: Хранилище кэша (`LRUCache`, `RedisCache` или совместимое).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    async def _call(self, func, *args):
+        executor = getattr(self.backend, "executor", None)
+        if executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def _lookup(self, key):
+        value = await self._call(self.backend.get, key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    async def _version(self, key):
+        version = await self._call(self.backend.get, key)
+        if version is None:
+            # Новая версия всегда уникальна, поэтому вытеснение ключа версии
+            # не может вернуть к жизни устаревшие записи
+            version = time.time_ns()
+            await self._call(self.backend.set, key, version)
+        return version
+
+    async def get_reminder(self, reminder_id):
+        """
+        Возвращает закэшированное напоминание по ID и версию записи.
+
+        Возвращает:
+            tuple: Напоминание или None и версия для `set_reminder`.
+        """
+        version = await self._version(f"version:id:{reminder_id}")
+        return await self._lookup(f"reminder:{reminder_id}:{version}"), version
+
+    async def set_reminder(self, reminder, version):
+        """
+        Кэширует напоминание по его ID.
+
+        Параметры:
+            reminder (dict): Напоминание, прочитанное из базы.
+            version (int): Версия, полученная от `get_reminder` до чтения из базы.
+        """
+        await self._call(self.backend.set, f"reminder:{reminder['id']}:{version}", reminder)
+
+    async def get_listing(self, phone_number, params):
+        """
+        Возвращает закэшированную страницу списка напоминаний и версию номера телефона.
+
+        Параметры:
+            phone_number (str): Номер телефона.
+            params (dict): Параметры запроса страницы.
+
+        Возвращает:
+            tuple: Страница или None и версия для `set_listing`.
+        """
+        version = await self._version(f"version:phone:{phone_number}")
+        return await self._lookup(f"list:{phone_number}:{version}:{json.dumps(params, sort_keys=True)}"), version
+
+    async def set_listing(self, phone_number, params, value, version):
+        """
+        Кэширует страницу списка напоминаний.
+
+        Параметры:
+            phone_number (str): Номер телефона.
+            params (dict): Параметры запроса страницы.
+            value: Страница списка.
+            version (int): Версия, полученная от `get_listing` до чтения из базы.
+        """
+        await self._call(self.backend.set, f"list:{phone_number}:{version}:{json.dumps(params, sort_keys=True)}",
+                         value)
+
+    async def invalidate(self, reminder_id=None, phone_number=None):
+        """
+        Делает недействительными напоминание и все страницы списков его номера телефона.
+
+        Параметры:
+            reminder_id (int | None): ID измененного напоминания.
+            phone_number (str | None): Номер телефона измененного напоминания.
+        """
+        if reminder_id is not None:
+            await self._call(self.backend.set, f"version:id:{reminder_id}", time.time_ns())
+        if phone_number is not None:
+            await self._call(self.backend.set, f"version:phone:{phone_number}", time.time_ns())
+
+    def stats(self):
+        """
+        Возвращает статистику хранилища кэша с попаданиями и промахами по напоминаниям и страницам.
+        """
+        with self._lock:
+            return {**self.backend.stats(), "hits": self.hits, "misses": self.misses}
+
+
+def create_cache(backend="memory", url=None, max_entries=10000, ttl=30.0):
+    """
+    Создает кэш напоминаний с выбранным хранилищем.
+
+    Параметры:
+        backend (str): `memory` для кэша в памяти процесса или `redis` для общего кэша.
+        url (str | None): Адрес Redis-совместимого сервера.
+        max_entries (int): Максимальное количество записей кэша в памяти.
+        ttl (float): Время жизни записи в секундах.
+
+    Возвращает:
+        ReminderCache: Кэш напоминаний.
+    """
+    if backend == "redis":
+        return ReminderCache(RedisCache(url, ttl=ttl))
+    return ReminderCache(LRUCache(max_entries=max_entries, ttl=ttl))
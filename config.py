@@ -5,6 +5,35 @@
 - `ACCOUNT_SID`: Идентификатор аккаунта Twilio.
 - `AUTH_TOKEN`: Токен аутентификации Twilio.
 - `FROM_NUMBER`: Номер телефона, с которого будут отправляться сообщения.
+- `DATABASE_PATH`: Путь к файлу базы данных SQLite.
+- `LEGACY_RESEND_WINDOW`: Сколько секунд назад могло наступить напоминание базы старого формата, чтобы после обновления его отправить.
+- `SHARD_COUNT`: Количество файлов базы данных (шардов), по которым распределяются напоминания.
+- `DB_POOL_SIZE`: Количество потоков для выполнения запросов к базе данных.
+- `GROUP_COMMIT_MAX_DELAY_MS`: Максимальное время накопления пачки групповой фиксации в миллисекундах.
+- `GROUP_COMMIT_MAX_ROWS`: Максимальное количество строк в пачке групповой фиксации.
+- `BULK_CHUNK_SIZE`: Количество строк массовой загрузки, сохраняемых одной транзакцией.
+- `CACHE_BACKEND`: Хранилище кэша чтения: `memory` или `redis`.
+- `CACHE_URL`: Адрес Redis-совместимого сервера для `CACHE_BACKEND=redis`.
+- `CACHE_MAX_ENTRIES`: Максимальное количество записей кэша в памяти.
+- `CACHE_TTL`: Время жизни записи кэша в секундах.
+- `RETENTION_DAYS`: Срок хранения обработанных напоминаний в основной таблице в днях.
+- `RETENTION_INTERVAL`: Пауза между проходами задачи хранения в секундах.
+- `RETENTION_BATCH_SIZE`: Количество строк, переносимых в архив одной транзакцией.
+- `RETENTION_ARCHIVE`: Сохранять ли старые напоминания в архивной таблице (1) или удалять (0).
+- `TWILIO_API_URL`: Базовый адрес API Twilio (можно заменить на локальный тестовый сервер).
+- `SEND_CONCURRENCY`: Максимальное количество одновременных запросов к Twilio.
+- `SEND_RATE`: Допустимое количество сообщений в секунду с номера отправителя.
+- `SEND_BURST`: Запас сообщений для кратковременных всплесков.
+- `SEND_MAX_RETRIES`: Количество повторов при ответах 429/5xx и сетевых ошибках.
+- `COALESCE_WINDOW`: Окно объединения напоминаний одного получателя в одно сообщение в секундах (0 - выключено).
+- `MAX_MESSAGE_LENGTH`: Максимальная длина текста сообщения WhatsApp.
+- `MESSAGE_CACHE_SIZE`: Количество отрисованных текстов напоминаний в кэше диспетчера.
+- `WORKER_ID`: Идентификатор процесса отправки (по умолчанию хост, PID и случайный суффикс).
+- `DISPATCH_LEASE`: Срок аренды захваченных для отправки напоминаний в секундах.
+- `DISPATCH_CLAIM_BATCH`: Максимальное количество напоминаний, захватываемых одним запросом.
+- `DISPATCH_MAX_INFLIGHT`: Максимальное количество захваченных процессом, но еще не отправленных напоминаний.
+- `LOG_MODE`: Режим записи логов: `queue` (фоновая запись пачками в JSON) или `sync`.
+- `LOG_SAMPLE_RATE`: Доля записываемых массовых сообщений об успешных операциях (от 0 до 1).
 
 Описание:
     Этот модуль загружает переменные окружения из файла `config.env`, который должен находиться
@@ -29,3 +58,90 @@ AUTH_TOKEN = os.getenv('AUTH_TOKEN')
 
 # Номер телефона для отправки сообщений
 FROM_NUMBER = os.getenv('FROM_NUMBER')
+
+# Путь к файлу базы данных SQLite
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'reminders.db')
+
+# Сколько секунд назад могло наступить напоминание базы старого формата, чтобы после обновления его отправить
+LEGACY_RESEND_WINDOW = float(os.getenv('LEGACY_RESEND_WINDOW', '0'))
+
+# Количество файлов базы данных (шардов), по которым распределяются напоминания
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+
+# Количество потоков для выполнения запросов к базе данных
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+
+# Максимальное время накопления пачки групповой фиксации в миллисекундах
+GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv('GROUP_COMMIT_MAX_DELAY_MS', '5'))
+
+# Максимальное количество строк в пачке групповой фиксации
+GROUP_COMMIT_MAX_ROWS = int(os.getenv('GROUP_COMMIT_MAX_ROWS', '500'))
+
+# Количество строк массовой загрузки, сохраняемых одной транзакцией
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '1000'))
+
+# Хранилище кэша чтения: memory или redis
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+
+# Адрес Redis-совместимого сервера для CACHE_BACKEND=redis
+CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+
+# Максимальное количество записей кэша в памяти
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+
+# Время жизни записи кэша в секундах
+CACHE_TTL = float(os.getenv('CACHE_TTL', '30'))
+
+# Срок хранения обработанных напоминаний в основной таблице в днях
+RETENTION_DAYS = float(os.getenv('RETENTION_DAYS', '30'))
+
+# Пауза между проходами задачи хранения в секундах
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))
+
+# Количество строк, переносимых в архив одной транзакцией
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+
+# Сохранять ли старые напоминания в архивной таблице (1) или удалять (0)
+RETENTION_ARCHIVE = os.getenv('RETENTION_ARCHIVE', '1') == '1'
+
+# Базовый адрес API Twilio
+TWILIO_API_URL = os.getenv('TWILIO_API_URL', 'https://api.twilio.com')
+
+# Максимальное количество одновременных запросов к Twilio
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '50'))
+
+# Допустимое количество сообщений в секунду с номера отправителя
+SEND_RATE = float(os.getenv('SEND_RATE', '80'))
+
+# Запас сообщений для кратковременных всплесков
+SEND_BURST = float(os.getenv('SEND_BURST', os.getenv('SEND_RATE', '80')))
+
+# Количество повторов при ответах 429/5xx и сетевых ошибках
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '5'))
+
+# Окно объединения напоминаний одного получателя в одно сообщение в секундах (0 - выключено)
+COALESCE_WINDOW = float(os.getenv('COALESCE_WINDOW', '0'))
+
+# Максимальная длина текста сообщения WhatsApp
+MAX_MESSAGE_LENGTH = int(os.getenv('MAX_MESSAGE_LENGTH', '1600'))
+
+# Количество отрисованных текстов напоминаний в кэше диспетчера
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', '1024'))
+
+# Идентификатор процесса отправки (по умолчанию хост, PID и случайный суффикс)
+WORKER_ID = os.getenv('WORKER_ID')
+
+# Срок аренды захваченных для отправки напоминаний в секундах
+DISPATCH_LEASE = float(os.getenv('DISPATCH_LEASE', '60'))
+
+# Максимальное количество напоминаний, захватываемых одним запросом
+DISPATCH_CLAIM_BATCH = int(os.getenv('DISPATCH_CLAIM_BATCH', '200'))
+
+# Максимальное количество захваченных процессом, но еще не отправленных напоминаний
+DISPATCH_MAX_INFLIGHT = int(os.getenv('DISPATCH_MAX_INFLIGHT', '1000'))
+
+# Режим записи логов: queue (фоновая запись пачками в JSON) или sync
+LOG_MODE = os.getenv('LOG_MODE', 'queue')
+
+# Доля записываемых массовых сообщений об успешных операциях (от 0 до 1)
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
@@ -2,131 +2,939 @@
 Модуль `database.py` предназначен для работы с базой данных SQLite, которая хранит напоминания.
 
 Основные функции:
-- `create_database()`: Создает базу данных и таблицу для хранения напоминаний.
-- `save_reminder(conn, c, reminder)`: Сохраняет напоминание в базу данных.
-- `get_reminders_by_phone_number(c, phone_number)`: Возвращает все напоминания для указанного номера телефона.
-- `get_reminder_by_id(cursor, reminder_id, phone_number)`: Возвращает напоминание по его ID и номеру телефона.
-- `get_reminder_by_id_for_phone(cursor, reminder_id, phone_number)`: Возвращает напоминание по его ID и номеру телефона или сообщение об ошибке.
-- `delete_reminder_by_id(conn, c, reminder_id)`: Удаляет напоминание по его ID.
+- `connect(path)`: Открывает соединение с настроенными параметрами (WAL, таймаут блокировки и т.д.).
+- `get_connection(path)`: Возвращает соединение текущего потока.
+- `transaction(conn)`: Контекстный менеджер явной транзакции записи.
+- `create_database(path)`: Создает базу данных и применяет миграции схемы.
+- `run_db(func, *args, path)`: Выполняет функцию доступа к данным в пуле потоков, не блокируя цикл событий.
+- `save_reminder(conn, reminder)`: Сохраняет напоминание в базу данных.
+- `save_reminders(conn, reminders)`: Сохраняет пачку напоминаний одной транзакцией.
+- `save_messages(conn, bodies)`: Сохраняет тексты напоминаний без повторов и возвращает их ID.
+- `get_message_bodies(conn, message_ids)`: Возвращает тексты по их ID.
+- `list_reminders(conn, phone_number, limit, after, due_from, due_to, status)`: Возвращает страницу напоминаний номера телефона.
+- `iter_reminders(path, phone_number, ...)`: Генератор всех подходящих напоминаний номера телефона постранично.
+- `get_reminder(conn, reminder_id)`: Возвращает напоминание по его ID.
+- `get_reminder_by_id(conn, reminder_id, phone_number)`: Возвращает напоминание по его ID и номеру телефона.
+- `get_reminder_by_id_for_phone(conn, reminder_id, phone_number)`: Возвращает напоминание по его ID и номеру телефона или сообщение об ошибке.
+- `delete_reminder_by_id(conn, reminder_id)`: Удаляет напоминание по его ID и возвращает его номер телефона.
+- `delete_reminders(conn, phone_number, due_from, due_to, batch_size)`: Удаляет напоминания по номеру телефона и/или диапазону времени.
+- `archive_reminders(conn, before, batch_size, archive)`: Переносит в архив одну порцию старых обработанных напоминаний.
+- `delete_unused_messages(conn, after, batch_size)`: Удаляет порцию текстов, на которые не ссылается ни одно напоминание.
+- `incremental_vacuum(conn, pages)`: Возвращает файловой системе до `pages` свободных страниц.
+- `get_due_times(conn, after, until, limit)`: Возвращает различные значения времени неотправленных напоминаний.
+- `count_due_reminders(conn, until)`: Возвращает количество неотправленных напоминаний до указанного времени.
+- `claim_due_reminders(conn, worker_id, until, now, lease_until, limit, phone_numbers)`: Атомарно захватывает наступившие напоминания для отправки.
+- `get_claimed_ids(conn, reminder_ids, worker_id)`: Возвращает ID напоминаний, захваченных процессом.
+- `renew_claims(conn, reminder_ids, worker_id, lease_until)`: Продлевает аренду захваченных напоминаний.
+- `mark_reminders(conn, results, now, worker_id)`: Отмечает напоминания как отправленные или неудачные и переносит повторяющиеся на следующее срабатывание.
 
 Описание:
     Этот модуль предоставляет функции для создания базы данных, добавления, получения и удаления напоминаний.
     База данных использует SQLite, а таблица `reminders` содержит следующие поля:
     - `id`: Уникальный идентификатор напоминания (автоинкремент).
     - `phone_number`: Номер телефона, на который отправляется напоминание.
-    - `reminder_text`: Текст напоминания.
+    - `message_id`: ID текста (шаблона) напоминания в таблице `messages`.
+    - `params`: Параметры шаблона в формате JSON или NULL для обычного текста.
     - `reminder_time`: Время напоминания в формате строки.
+    - `status`: Статус доставки (0 - ожидает, 1 - отправлено, 2 - ошибка отправки).
+    - `due_at`: Время напоминания в секундах эпохи (Unix time).
+    - `repeat_cron`, `repeat_every`, `repeat_until`: Правило повторения (cron-выражение
+      или интервал в секундах) и время его окончания.
+    - `claimed_by`, `lease_until`: Процесс, захвативший напоминание для отправки, и срок аренды.
+
+    Тексты напоминаний хранятся в таблице `messages` по одной строке на уникальный текст
+    (ключ - хеш SHA-256 текста), а напоминания ссылаются на них по `message_id`. Поэтому
+    рассылка одного текста на много номеров хранит текст один раз. Текст может быть
+    шаблоном `string.Template` (например, `Здравствуйте, $name!`), тогда напоминание
+    хранит только небольшие параметры получателя `params`, а текст отрисовывается при
+    отправке (см. модуль `messages.py`). В ответах API напоминание содержит текст
+    (шаблон) `reminder_text` и параметры `params`. Тексты без ссылок удаляются задачей
+    хранения (`delete_unused_messages`).
+
+    Повторяющееся напоминание хранится одной строкой: `due_at` и `reminder_time` содержат
+    время ближайшего срабатывания и после каждой отправки переносятся на следующее
+    (см. модуль `recurrence.py`). Статус доставки такой строки остается `0`, пока
+    у правила есть будущие срабатывания, поэтому напоминание постоянно находится
+    в частичном индексе ожидающих напоминаний.
+
+    Несколько процессов (воркеры uvicorn или реплики с общим файлом базы) отправляют
+    напоминания без повторов: перед отправкой процесс атомарно захватывает наступившие
+    напоминания одним запросом `UPDATE ... RETURNING`, записывая свой идентификатор
+    и срок аренды (`claim_due_reminders`). Захваченное напоминание недоступно другим
+    процессам до истечения аренды; аренда продлевается, пока отправка не завершена,
+    а после аварийной остановки процесса истекает, и напоминание захватывает другой
+    процесс. Результат отправки записывается только процессом, который владеет арендой.
+
+    Длительность запросов каждой функции записывается в гистограмму
+    `reminders_db_query_duration_seconds` модуля `metrics.py`.
+
+    Каждый поток работает со своим соединением (`get_connection`), а обработчики FastAPI
+    вызывают функции модуля через `run_db`, который выполняет их в отдельном пуле потоков.
+    Соединения работают в режиме WAL, поэтому чтение не блокируется записью.
+
+    Обработанные (отправленные и неудачные) напоминания старше срока хранения переносятся
+    небольшими порциями в таблицу `reminders_archive`, а освободившееся место возвращается
+    через `PRAGMA incremental_vacuum`, поэтому основная таблица остается небольшой.
+
+    Версия схемы хранится в `PRAGMA user_version`; `create_database` применяет недостающие
+    миграции из списка `MIGRATIONS`, поэтому существующие файлы `reminders.db` обновляются
+    при запуске автоматически.
 
     Модуль также поддерживает проверку принадлежности напоминания определенному номеру телефона,
     что позволяет избежать несанкционированного доступа к чужим напоминаниям.
 
 Пример использования:
-    >>> from database import create_database, save_reminder, get_reminders_by_phone_number, delete_reminder_by_id
-    >>> conn, c = create_database()
+    >>> from database import create_database, save_reminder, list_reminders, delete_reminder_by_id
+    >>> conn = create_database()
     >>> reminder = {"phone_number": "+79123456789", "reminder_text": "Позвонить маме", "reminder_time": "2023-10-01 12:00:00"}
-    >>> save_reminder(conn, c, reminder)
-    >>> reminders = get_reminders_by_phone_number(c, "+79123456789")
-    >>> reminder = get_reminder_by_id(c, 1, "+79123456789")
-    >>> delete_reminder_by_id(conn, c, 1)
+    >>> reminder_id = save_reminder(conn, reminder)
+    >>> reminders = list_reminders(conn, "+79123456789", limit=100)
+    >>> reminder = get_reminder_by_id(conn, reminder_id, "+79123456789")
+    >>> delete_reminder_by_id(conn, reminder_id)
 """
 
+import asyncio
+import datetime
+import hashlib
+import json
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import DATABASE_PATH, DB_POOL_SIZE, LEGACY_RESEND_WINDOW
+from metrics import Histogram, timed
+from recurrence import next_fire_time
+
+# Формат времени напоминания
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Статусы доставки напоминания
+STATUS_PENDING = 0
+STATUS_SENT = 1
+STATUS_FAILED = 2
+
+# Названия статусов доставки для API
+STATUS_NAMES = {
+    STATUS_PENDING: "pending",
+    STATUS_SENT: "sent",
+    STATUS_FAILED: "failed",
+}
+
+# Параметры соединения, применяемые к каждому открытому соединению
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+# Длительность запросов к базе данных по функциям
+QUERY_DURATION = Histogram(
+    "reminders_db_query_duration_seconds", "Длительность запросов к SQLite по функциям", ["function"])
+
+# Соединения текущего потока по пути к файлу базы данных
+_local = threading.local()
+
+# Пул потоков для выполнения запросов вне цикла событий
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+def due_timestamp(reminder_time):
+    """
+    Переводит время напоминания из строки в секунды эпохи.
+
+    Параметры:
+        reminder_time (str): Время напоминания в формате `YYYY-MM-DD HH:MM:SS` (локальное время).
+
+    Возвращает:
+        int: Время напоминания в секундах эпохи.
+    """
+    return int(datetime.datetime.strptime(reminder_time, TIME_FORMAT).timestamp())
+
+def format_timestamp(due_at):
+    """
+    Переводит время в секундах эпохи в строку времени напоминания.
 
-def create_database():
+    Параметры:
+        due_at (int): Время в секундах эпохи.
+
+    Возвращает:
+        str: Время в формате `YYYY-MM-DD HH:MM:SS` (локальное время).
+    """
+    return datetime.datetime.fromtimestamp(due_at).strftime(TIME_FORMAT)
+
+def message_hash(body):
     """
-    Создает базу данных и таблицу для хранения напоминаний.
+    Возвращает хеш текста, по которому текст хранится в таблице `messages`.
+
+    Параметры:
+        body (str): Текст или шаблон напоминания.
 
     Возвращает:
-        tuple: Кортеж из двух элементов:
-            - conn: Объект соединения с базой данных.
-            - c: Объект курсора для выполнения SQL-запросов.
+        bytes: Хеш SHA-256 текста в кодировке UTF-8.
     """
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS reminders
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, phone_number TEXT, reminder_text TEXT, reminder_time TEXT)''')
-    conn.commit()
-    return conn, c
+    return hashlib.sha256(body.encode("utf-8")).digest()
 
-def save_reminder(conn, c, reminder):
+def encode_params(params):
+    """
+    Переводит параметры шаблона в JSON с упорядоченными ключами.
+
+    Одинаковые параметры всегда дают одну и ту же строку, поэтому она служит ключом
+    кэша отрисованных текстов.
+
+    Параметры:
+        params (dict | None): Параметры шаблона.
+
+    Возвращает:
+        str | None: JSON-строка или None, если параметров нет.
+    """
+    if not params:
+        return None
+    return json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def connect(path=DATABASE_PATH):
+    """
+    Открывает соединение с базой данных и применяет параметры `PRAGMAS`.
+
+    Соединение работает в режиме автокоммита: одиночные запросы фиксируются сразу,
+    а несколько запросов объединяются в транзакцию через `transaction(conn)`.
+
+    Параметры:
+        path (str): Путь к файлу базы данных.
+
+    Возвращает:
+        sqlite3.Connection: Объект соединения с базой данных.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def get_connection(path=DATABASE_PATH):
+    """
+    Возвращает соединение текущего потока, открывая его при первом обращении.
+
+    Параметры:
+        path (str): Путь к файлу базы данных.
+
+    Возвращает:
+        sqlite3.Connection: Объект соединения с базой данных.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = connect(path)
+    return conn
+
+@contextmanager
+def transaction(conn):
+    """
+    Выполняет блок в транзакции записи (`BEGIN IMMEDIATE`) с откатом при ошибке.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+async def run_db(func, *args, path=DATABASE_PATH, **kwargs):
+    """
+    Выполняет функцию доступа к данным в пуле потоков с соединением этого потока.
+
+    Параметры:
+        func (callable): Функция вида `func(conn, *args, **kwargs)`.
+        path (str): Путь к файлу базы данных.
+
+    Возвращает:
+        Результат вызова `func`.
+    """
+    def call():
+        return func(get_connection(path), *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+def _migrate_base_schema(conn):
+    """
+    Создает таблицу напоминаний и добавляет статус доставки в старые базы.
+
+    Напоминания старой базы, время которых прошло раньше `LEGACY_RESEND_WINDOW` секунд
+    до обновления, отмечаются отправленными, чтобы диспетчер не отправил их повторно.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS reminders
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, phone_number TEXT, reminder_text TEXT, reminder_time TEXT,
+                     status INTEGER NOT NULL DEFAULT 0)''')
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(reminders)")]
+    if 'status' not in columns:
+        conn.execute("ALTER TABLE reminders ADD COLUMN status INTEGER NOT NULL DEFAULT 0")
+        # Старый планировщик не хранил статус, поэтому прошедшие напоминания считаются отправленными им
+        cutoff = int(time.time() - LEGACY_RESEND_WINDOW)
+        conn.execute("UPDATE reminders SET status = ? "
+                     "WHERE CAST(strftime('%s', reminder_time, 'utc') AS INTEGER) < ?", (STATUS_SENT, cutoff))
+
+def _migrate_due_at(conn):
+    """
+    Добавляет числовое время напоминания `due_at` и индексы по номеру телефона и времени.
+    """
+    conn.execute("ALTER TABLE reminders ADD COLUMN due_at INTEGER")
+    # Модификатор 'utc' переводит локальное время строки в UTC, как и `due_timestamp`
+    conn.execute("UPDATE reminders SET due_at = CAST(strftime('%s', reminder_time, 'utc') AS INTEGER)")
+    conn.execute("DROP INDEX IF EXISTS idx_reminders_status_time")
+    conn.execute("CREATE INDEX idx_reminders_phone ON reminders (phone_number, due_at, id)")
+    conn.execute("CREATE INDEX idx_reminders_pending_due ON reminders (due_at, id) WHERE status = 0")
+
+def _migrate_archive(conn):
+    """
+    Создает архивную таблицу и индекс обработанных напоминаний для задачи хранения.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS reminders_archive
+                    (id INTEGER PRIMARY KEY, phone_number TEXT, reminder_text TEXT, reminder_time TEXT,
+                     status INTEGER NOT NULL, due_at INTEGER, archived_at INTEGER NOT NULL)''')
+    conn.execute("CREATE INDEX idx_reminders_done_due ON reminders (due_at) WHERE status != 0")
+
+def _migrate_recurrence(conn):
+    """
+    Добавляет правило повторения напоминания в основную и архивную таблицы.
+    """
+    for table in ("reminders", "reminders_archive"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN repeat_cron TEXT")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN repeat_every INTEGER")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN repeat_until TEXT")
+
+def _migrate_claims(conn):
+    """
+    Добавляет захват напоминания процессом отправки с ограниченным сроком аренды.
+    """
+    conn.execute("ALTER TABLE reminders ADD COLUMN claimed_by TEXT")
+    conn.execute("ALTER TABLE reminders ADD COLUMN lease_until REAL")
+
+def _migrate_messages(conn):
+    """
+    Переносит тексты напоминаний в таблицу `messages` (одна строка на уникальный текст)
+    и добавляет ссылку на текст и параметры шаблона.
+    """
+    # AUTOINCREMENT исключает повторную выдачу ID удаленного текста, закэшированного при отправке
+    conn.execute('''CREATE TABLE messages
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, hash BLOB NOT NULL UNIQUE, body TEXT NOT NULL)''')
+    conn.create_function("message_hash", 1, message_hash, deterministic=True)
+    for table in ("reminders", "reminders_archive"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN message_id INTEGER")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN params TEXT")
+        conn.execute("INSERT OR IGNORE INTO messages (hash, body) "
+                     f"SELECT message_hash(reminder_text), reminder_text FROM {table} WHERE reminder_text IS NOT NULL")
+        conn.execute(f"UPDATE {table} SET message_id = "
+                     f"(SELECT id FROM messages WHERE hash = message_hash({table}.reminder_text))")
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN reminder_text")
+        # Индекс нужен задаче хранения, чтобы находить тексты без ссылок без полного просмотра таблиц
+        conn.execute(f"CREATE INDEX idx_{table}_message ON {table} (message_id)")
+
+# Миграции схемы; номер версии равен позиции миграции в списке
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_due_at,
+    _migrate_archive,
+    _migrate_recurrence,
+    _migrate_claims,
+    _migrate_messages,
+]
+
+def migrate(conn):
+    """
+    Применяет к базе данных недостающие миграции схемы.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+    """
+    with transaction(conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+def create_database(path=DATABASE_PATH):
+    """
+    Создает базу данных, применяет миграции схемы и возвращает соединение.
+
+    Параметры:
+        path (str): Путь к файлу базы данных.
+
+    Возвращает:
+        sqlite3.Connection: Объект соединения с базой данных.
+    """
+    conn = connect(path)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # Режим INCREMENTAL вступает в силу только после полного VACUUM (однократно)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    migrate(conn)
+    return conn
+
+# Колонки напоминания, возвращаемые API (текст читается из таблицы `messages`)
+REMINDER_COLUMNS = ("id, phone_number, (SELECT body FROM messages WHERE messages.id = message_id), reminder_time, "
+                    "repeat_cron, repeat_every, repeat_until, params")
+
+# Хранимые колонки напоминания, переносимые в архив
+STORED_COLUMNS = "id, phone_number, message_id, params, reminder_time, repeat_cron, repeat_every, repeat_until"
+
+def _row_to_reminder(row):
+    return {
+        "id": row[0],
+        "phone_number": row[1],
+        "reminder_text": row[2],
+        "reminder_time": row[3],
+        "repeat_cron": row[4],
+        "repeat_every": row[5],
+        "repeat_until": row[6],
+        "params": json.loads(row[7]) if row[7] else None
+    }
+
+def _reminder_values(reminder, due_at, message_ids):
+    return (reminder['phone_number'], message_ids[reminder['reminder_text']], encode_params(reminder.get('params')),
+            reminder['reminder_time'], due_at,
+            reminder.get('repeat_cron'), reminder.get('repeat_every'), reminder.get('repeat_until'))
+
+# Запрос вставки напоминания
+INSERT_REMINDER = ("INSERT INTO reminders (phone_number, message_id, params, reminder_time, due_at, "
+                   "repeat_cron, repeat_every, repeat_until) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+def save_messages(conn, bodies):
+    """
+    Сохраняет тексты в таблицу `messages` без повторов и возвращает их ID.
+
+    Текст, уже сохраненный ранее (например, общий текст рассылки), не записывается повторно.
+    Функция вызывается внутри транзакции сохранения напоминаний.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        bodies (iterable): Тексты или шаблоны напоминаний.
+
+    Возвращает:
+        dict: ID сохраненного текста по самому тексту.
+    """
+    message_ids = {}
+    for body in bodies:
+        if body in message_ids:
+            continue
+        digest = message_hash(body)
+        row = conn.execute("SELECT id FROM messages WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            row = (conn.execute("INSERT INTO messages (hash, body) VALUES (?, ?)", (digest, body)).lastrowid,)
+        message_ids[body] = row[0]
+    return message_ids
+
+@timed(QUERY_DURATION)
+def get_message_bodies(conn, message_ids):
+    """
+    Возвращает тексты по их ID в таблице `messages`.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        message_ids (list): ID текстов.
+
+    Возвращает:
+        dict: Текст по ID; отсутствующие ID в словарь не попадают.
+    """
+    bodies = {}
+    for start in range(0, len(message_ids), 500):
+        chunk = message_ids[start:start + 500]
+        bodies.update(conn.execute(
+            f"SELECT id, body FROM messages WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+    return bodies
+
+@timed(QUERY_DURATION)
+def save_reminder(conn, reminder):
     """
     Сохраняет напоминание в базу данных.
 
     Параметры:
         conn: Объект соединения с базой данных.
-        c: Объект курсора для выполнения SQL-запросов.
         reminder (dict): Словарь с данными напоминания:
             - phone_number (str): Номер телефона.
-            - reminder_text (str): Текст напоминания.
+            - reminder_text (str): Текст или шаблон напоминания.
             - reminder_time (str): Время напоминания в формате строки.
+            - params (dict | None): Необязательные параметры шаблона.
+            - repeat_cron, repeat_every, repeat_until: Необязательное правило повторения.
+
+    Возвращает:
+        int: ID сохраненного напоминания.
     """
-    c.execute("INSERT INTO reminders (phone_number, reminder_text, reminder_time) VALUES (?, ?, ?)",
-              (reminder['phone_number'], reminder['reminder_text'], reminder['reminder_time']))
-    conn.commit()
+    with transaction(conn):
+        message_ids = save_messages(conn, [reminder['reminder_text']])
+        c = conn.execute(INSERT_REMINDER,
+                         _reminder_values(reminder, due_timestamp(reminder['reminder_time']), message_ids))
+    return c.lastrowid
 
-def get_reminders_by_phone_number(c, phone_number):
+@timed(QUERY_DURATION)
+def save_reminders(conn, reminders):
     """
-    Возвращает все напоминания для указанного номера телефона.
+    Сохраняет пачку напоминаний одной транзакцией через `executemany`.
 
     Параметры:
-        c: Объект курсора для выполнения SQL-запросов.
+        conn: Объект соединения с базой данных.
+        reminders (list): Список словарей с полями `phone_number`, `reminder_text`, `reminder_time`, `due_at`,
+            необязательными параметрами шаблона `params` и правилом повторения `repeat_cron`,
+            `repeat_every`, `repeat_until`.
+
+    Возвращает:
+        list: ID сохраненных напоминаний в том же порядке.
+    """
+    if not reminders:
+        return []
+    with transaction(conn):
+        message_ids = save_messages(conn, (reminder['reminder_text'] for reminder in reminders))
+        conn.executemany(INSERT_REMINDER,
+                         [_reminder_values(reminder, reminder['due_at'], message_ids) for reminder in reminders])
+        # Внутри транзакции записи ID автоинкремента выдаются подряд
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(reminders) + 1, last_id + 1))
+
+def _list_query(phone_number, limit, after, due_from, due_to, status):
+    """
+    Строит запрос страницы напоминаний номера телефона по ключу `(due_at, id)`.
+    """
+    conditions = ["phone_number = ?"]
+    params = [phone_number]
+    if after is not None:
+        conditions.append("(due_at, id) > (?, ?)")
+        params.extend(after)
+    if due_from is not None:
+        conditions.append("due_at >= ?")
+        params.append(due_from)
+    if due_to is not None:
+        conditions.append("due_at <= ?")
+        params.append(due_to)
+    if status is not None:
+        conditions.append("status = ?")
+        params.append(status)
+    params.append(limit)
+    query = (f"SELECT {REMINDER_COLUMNS}, status, due_at FROM reminders "
+             f"WHERE {' AND '.join(conditions)} ORDER BY due_at, id LIMIT ?")
+    return query, params
+
+def _row_to_listed_reminder(row):
+    reminder = _row_to_reminder(row)
+    reminder["status"] = STATUS_NAMES.get(row[8], str(row[8]))
+    reminder["due_at"] = row[9]
+    return reminder
+
+@timed(QUERY_DURATION)
+def list_reminders(conn, phone_number, limit, after=None, due_from=None, due_to=None, status=None):
+    """
+    Возвращает страницу напоминаний для указанного номера телефона.
+
+    Страницы читаются по ключу `(due_at, id)` с использованием индекса `idx_reminders_phone`,
+    поэтому стоимость запроса не зависит от номера страницы.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
         phone_number (str): Номер телефона.
+        limit (int): Максимальное количество напоминаний на странице.
+        after (tuple | None): Ключ `(due_at, id)` последнего напоминания предыдущей страницы.
+        due_from (int | None): Нижняя граница времени напоминания (секунды эпохи) включительно.
+        due_to (int | None): Верхняя граница времени напоминания (секунды эпохи) включительно.
+        status (int | None): Статус доставки.
+
+    Возвращает:
+        list: Список напоминаний в виде словарей с полями `status` и `due_at`.
+    """
+    query, params = _list_query(phone_number, limit, after, due_from, due_to, status)
+    return [_row_to_listed_reminder(row) for row in conn.execute(query, params).fetchall()]
+
+def iter_reminders(path, phone_number, after=None, due_from=None, due_to=None, status=None, limit=None,
+                   page_size=500):
+    """
+    Генератор напоминаний номера телефона, читающий базу страницами по `page_size`.
+
+    Генератор открывает собственное соединение и выполняет отдельный короткий запрос
+    на каждую страницу, поэтому память не зависит от общего количества напоминаний,
+    а чтение не удерживает транзакцию на все время передачи ответа.
+
+    Параметры:
+        path (str): Путь к файлу базы данных.
+        phone_number (str): Номер телефона.
+        after, due_from, due_to, status: Те же условия, что и у `list_reminders`.
+        limit (int | None): Максимальное общее количество напоминаний.
+        page_size (int): Количество напоминаний, читаемых одним запросом.
+
+    Возвращает:
+        Генератор словарей напоминаний.
+    """
+    conn = connect(path)
+    try:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            page = list_reminders(conn, phone_number, size, after, due_from, due_to, status)
+            yield from page
+            if len(page) < size:
+                return
+            after = (page[-1]["due_at"], page[-1]["id"])
+            if remaining is not None:
+                remaining -= len(page)
+    finally:
+        conn.close()
+
+@timed(QUERY_DURATION)
+def get_reminder(conn, reminder_id: int):
+    """
+    Возвращает напоминание по его ID без проверки номера телефона.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        reminder_id (int): ID напоминания.
 
     Возвращает:
-        list: Список напоминаний, где каждое напоминание представлено в виде кортежа.
+        dict: Напоминание, если найдено, иначе None.
     """
-    c.execute("SELECT * FROM reminders WHERE phone_number=?", (phone_number,))
-    return c.fetchall()
+    c = conn.execute(f"SELECT {REMINDER_COLUMNS} FROM reminders WHERE id = ?", (reminder_id,))
+    reminder = c.fetchone()
+    if reminder:
+        return _row_to_reminder(reminder)
+    return None
 
-def get_reminder_by_id(cursor, reminder_id: int, phone_number: str):
+@timed(QUERY_DURATION)
+def get_reminder_by_id(conn, reminder_id: int, phone_number: str):
     """
     Возвращает напоминание по его ID и номеру телефона.
 
     Параметры:
-        cursor: Курсор базы данных.
+        conn: Объект соединения с базой данных.
         reminder_id (int): ID напоминания.
         phone_number (str): Номер телефона.
 
     Возвращает:
         dict: Напоминание, если найдено и принадлежит указанному номеру, иначе None.
     """
-    cursor.execute("SELECT * FROM reminders WHERE id = ? AND phone_number = ?", (reminder_id, phone_number))
-    reminder = cursor.fetchone()
+    c = conn.execute(f"SELECT {REMINDER_COLUMNS} FROM reminders WHERE id = ? AND phone_number = ?",
+                     (reminder_id, phone_number))
+    reminder = c.fetchone()
     if reminder:
-        return {
-            "id": reminder[0],
-            "phone_number": reminder[1],
-            "reminder_text": reminder[2],
-            "reminder_time": reminder[3]
-        }
+        return _row_to_reminder(reminder)
     return None
 
-def get_reminder_by_id_for_phone(cursor, reminder_id: int, phone_number: str):
+def get_reminder_by_id_for_phone(conn, reminder_id: int, phone_number: str):
     """
     Возвращает напоминание по его ID и номеру телефона или сообщение об ошибке.
 
     Параметры:
-        cursor: Курсор базы данных.
+        conn: Объект соединения с базой данных.
         reminder_id (int): ID напоминания.
         phone_number (str): Номер телефона.
 
     Возвращает:
         dict: Напоминание, если найдено и принадлежит указанному номеру, иначе сообщение об ошибке.
     """
-    reminder = get_reminder_by_id(cursor, reminder_id, phone_number)
+    reminder = get_reminder_by_id(conn, reminder_id, phone_number)
     if reminder:
         return {"reminder": reminder}
     else:
         return {"message": "Напоминание не найдено или не принадлежит указанному номеру телефона"}
 
-def delete_reminder_by_id(conn, c, reminder_id):
+@timed(QUERY_DURATION)
+def delete_reminder_by_id(conn, reminder_id):
     """
     Удаляет напоминание по его ID.
 
     Параметры:
         conn: Объект соединения с базой данных.
-        c: Объект курсора для выполнения SQL-запросов.
         reminder_id (int): ID напоминания.
+
+    Возвращает:
+        str | None: Номер телефона удаленного напоминания или None, если напоминание не найдено.
+    """
+    row = conn.execute("DELETE FROM reminders WHERE id=? RETURNING phone_number", (reminder_id,)).fetchone()
+    return row[0] if row else None
+
+@timed(QUERY_DURATION)
+def delete_reminders(conn, phone_number=None, due_from=None, due_to=None, batch_size=1000):
+    """
+    Удаляет напоминания по номеру телефона и/или диапазону времени.
+
+    Удаление выполняется порциями по `batch_size` строк, чтобы не удерживать
+    блокировку записи надолго.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        phone_number (str | None): Номер телефона.
+        due_from (int | None): Нижняя граница времени напоминания (секунды эпохи) включительно.
+        due_to (int | None): Верхняя граница времени напоминания (секунды эпохи) включительно.
+        batch_size (int): Количество строк, удаляемых одним запросом.
+
+    Возвращает:
+        list: Пары `(id, phone_number)` удаленных напоминаний.
+    """
+    conditions = []
+    params = []
+    if phone_number is not None:
+        conditions.append("phone_number = ?")
+        params.append(phone_number)
+    if due_from is not None:
+        conditions.append("due_at >= ?")
+        params.append(due_from)
+    if due_to is not None:
+        conditions.append("due_at <= ?")
+        params.append(due_to)
+    if not conditions:
+        raise ValueError("Необходимо указать номер телефона или диапазон времени")
+    query = (f"DELETE FROM reminders WHERE id IN (SELECT id FROM reminders WHERE {' AND '.join(conditions)} "
+             "LIMIT ?) RETURNING id, phone_number")
+    deleted = []
+    while True:
+        rows = conn.execute(query, (*params, batch_size)).fetchall()
+        deleted.extend(rows)
+        if len(rows) < batch_size:
+            return deleted
+
+@timed(QUERY_DURATION)
+def archive_reminders(conn, before, batch_size=500, archive=True):
+    """
+    Переносит в архив одну порцию обработанных напоминаний старше `before`.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        before (int): Время (секунды эпохи), раньше которого напоминания считаются старыми.
+        batch_size (int): Максимальное количество строк в порции.
+        archive (bool): Сохранять ли строки в `reminders_archive` перед удалением.
+
+    Возвращает:
+        int: Количество перенесенных строк.
+    """
+    with transaction(conn):
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM reminders WHERE status != 0 AND due_at < ? LIMIT ?", (before, batch_size))]
+        if not ids:
+            return 0
+        placeholders = ",".join("?" * len(ids))
+        if archive:
+            conn.execute("INSERT OR REPLACE INTO reminders_archive "
+                         f"({STORED_COLUMNS}, status, due_at, archived_at) "
+                         f"SELECT {STORED_COLUMNS}, status, due_at, CAST(strftime('%s', 'now') AS INTEGER) "
+                         f"FROM reminders WHERE id IN ({placeholders})", ids)
+        conn.execute(f"DELETE FROM reminders WHERE id IN ({placeholders})", ids)
+    return len(ids)
+
+@timed(QUERY_DURATION)
+def delete_unused_messages(conn, after=0, batch_size=500):
+    """
+    Удаляет одну порцию текстов, на которые не ссылается ни одно напоминание, в том числе архивное.
+
+    Просматривается не больше `batch_size` текстов с ID больше `after`, а ссылки проверяются
+    по индексам `message_id`, поэтому транзакция записи остается короткой.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        after (int): ID текста, после которого начинается порция.
+        batch_size (int): Максимальное количество просматриваемых текстов.
+
+    Возвращает:
+        tuple: Количество удаленных текстов и ID последнего просмотренного текста
+            (None, если просмотрены все тексты).
+    """
+    with transaction(conn):
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM messages WHERE id > ? ORDER BY id LIMIT ?", (after, batch_size))]
+        if not ids:
+            return 0, None
+        c = conn.execute("DELETE FROM messages WHERE id BETWEEN ? AND ? "
+                         "AND NOT EXISTS (SELECT 1 FROM reminders WHERE reminders.message_id = messages.id) "
+                         "AND NOT EXISTS (SELECT 1 FROM reminders_archive "
+                         "WHERE reminders_archive.message_id = messages.id)", (ids[0], ids[-1]))
+    return c.rowcount, ids[-1] if len(ids) == batch_size else None
+
+def incremental_vacuum(conn, pages):
+    """
+    Возвращает файловой системе до `pages` свободных страниц базы данных.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        pages (int): Максимальное количество освобождаемых страниц.
+    """
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+
+# Колонки напоминания, передаваемые диспетчеру (текст отрисовывается при отправке)
+DUE_COLUMNS = "id, phone_number, message_id, params, reminder_time, due_at"
+
+def _row_to_due_reminder(row):
+    return {"id": row[0], "phone_number": row[1], "message_id": row[2], "params": row[3],
+            "reminder_time": row[4], "due_at": row[5]}
+
+# Различные значения времени ожидающих напоминаний: каждое следующее значение находится
+# отдельным поиском MIN по частичному индексу, поэтому напоминания с одним временем не просматриваются
+DUE_TIMES_QUERY = """
+WITH RECURSIVE times(due_at) AS (
+    SELECT (SELECT MIN(due_at) FROM reminders WHERE status = 0 AND due_at > ? AND due_at <= ?)
+    UNION ALL
+    SELECT (SELECT MIN(due_at) FROM reminders WHERE status = 0 AND due_at > times.due_at AND due_at <= ?)
+    FROM times WHERE times.due_at IS NOT NULL
+)
+SELECT due_at FROM times WHERE due_at IS NOT NULL LIMIT ?
+"""
+
+@timed(QUERY_DURATION)
+def get_due_times(conn, after, until, limit):
+    """
+    Возвращает различные значения времени неотправленных напоминаний по возрастанию.
+
+    Выборка использует частичный индекс `idx_reminders_pending_due` и читает по одной
+    записи индекса на значение времени, поэтому ее стоимость не зависит от количества
+    напоминаний с одним временем.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        after (int | None): Время, после которого начинается выборка (секунды эпохи).
+        until (int): Верхняя граница времени напоминания (секунды эпохи) включительно.
+        limit (int): Максимальное количество значений.
+
+    Возвращает:
+        list: Время напоминаний в секундах эпохи.
+    """
+    # Условие `status = 0` записано литералом, чтобы планировщик выбрал частичный индекс
+    after = after if after is not None else -2 ** 63
+    return [row[0] for row in conn.execute(DUE_TIMES_QUERY, (after, until, until, limit))]
+
+@timed(QUERY_DURATION)
+def count_due_reminders(conn, until):
+    """
+    Возвращает количество неотправленных напоминаний со временем не позже `until`.
+
+    Подсчет выполняется только по частичному индексу `idx_reminders_pending_due`.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        until (int): Верхняя граница времени напоминания (секунды эпохи) включительно.
+
+    Возвращает:
+        int: Количество напоминаний, включая просроченные и захваченные для отправки.
+    """
+    return conn.execute("SELECT COUNT(*) FROM reminders WHERE status = 0 AND due_at <= ?", (until,)).fetchone()[0]
+
+@timed(QUERY_DURATION)
+def claim_due_reminders(conn, worker_id, until, now, lease_until, limit, phone_numbers=None):
     """
-    c.execute("DELETE FROM reminders WHERE id=?", (reminder_id,))
-    conn.commit()
+    Атомарно захватывает порцию наступивших неотправленных напоминаний для отправки.
+
+    Захватываются напоминания без аренды или с истекшей арендой (например, захваченные
+    аварийно остановленным процессом). Запрос выполняется одной командой записи,
+    поэтому два процесса не могут захватить одно напоминание.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        worker_id (str): Идентификатор процесса отправки.
+        until (float): Верхняя граница времени напоминания (секунды эпохи) включительно.
+        now (float): Текущее время; аренды, истекшие до него, считаются свободными.
+        lease_until (float): Срок аренды захваченных напоминаний.
+        limit (int): Максимальное количество захватываемых напоминаний.
+        phone_numbers (iterable | None): Захватывать только напоминания этих номеров телефона.
+
+    Возвращает:
+        list: Захваченные напоминания (поля `id`, `phone_number`, `message_id`, `params`, `reminder_time`, `due_at`) в порядке времени.
+    """
+    conditions = ["status = 0", "due_at <= ?", "(lease_until IS NULL OR lease_until < ?)"]
+    params = [until, now]
+    if phone_numbers is not None:
+        phone_numbers = list(phone_numbers)
+        conditions.append(f"phone_number IN ({','.join('?' * len(phone_numbers))})")
+        params.extend(phone_numbers)
+    # Условие `status = 0` записано литералом, чтобы планировщик выбрал частичный индекс
+    c = conn.execute("UPDATE reminders SET claimed_by = ?, lease_until = ? WHERE id IN "
+                     f"(SELECT id FROM reminders WHERE {' AND '.join(conditions)} ORDER BY due_at, id LIMIT ?) "
+                     f"RETURNING {DUE_COLUMNS}",
+                     (worker_id, lease_until, *params, limit))
+    rows = sorted(c.fetchall(), key=lambda row: (row[5], row[0]))
+    return [_row_to_due_reminder(row) for row in rows]
+
+@timed(QUERY_DURATION)
+def get_claimed_ids(conn, reminder_ids, worker_id):
+    """
+    Возвращает ID напоминаний, которые существуют, не отправлены и захвачены процессом `worker_id`.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        reminder_ids (list): ID проверяемых напоминаний.
+        worker_id (str): Идентификатор процесса отправки.
+
+    Возвращает:
+        set: ID напоминаний из `reminder_ids`, аренда которых принадлежит процессу.
+    """
+    claimed = set()
+    for start in range(0, len(reminder_ids), 500):
+        chunk = reminder_ids[start:start + 500]
+        claimed.update(row[0] for row in conn.execute(
+            f"SELECT id FROM reminders WHERE id IN ({','.join('?' * len(chunk))}) AND status = 0 AND claimed_by = ?",
+            (*chunk, worker_id)))
+    return claimed
+
+@timed(QUERY_DURATION)
+def renew_claims(conn, reminder_ids, worker_id, lease_until):
+    """
+    Продлевает аренду напоминаний, которые процесс еще отправляет.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        reminder_ids (list): ID захваченных напоминаний.
+        worker_id (str): Идентификатор процесса отправки.
+        lease_until (float): Новый срок аренды.
+    """
+    with transaction(conn):
+        for start in range(0, len(reminder_ids), 500):
+            chunk = reminder_ids[start:start + 500]
+            conn.execute(f"UPDATE reminders SET lease_until = ? WHERE id IN ({','.join('?' * len(chunk))}) "
+                         "AND claimed_by = ?", (lease_until, *chunk, worker_id))
+
+@timed(QUERY_DURATION)
+def mark_reminders(conn, results, now=None, worker_id=None):
+    """
+    Отмечает напоминания как отправленные или неудачные.
+
+    Повторяющиеся напоминания с будущими срабатываниями остаются ожидающими: их `due_at`
+    и `reminder_time` переносятся на следующее срабатывание правила после `now`.
+    Статус доставки выставляется, только когда правило исчерпано. Аренда напоминаний
+    снимается.
+
+    Параметры:
+        conn: Объект соединения с базой данных.
+        results (list): Список пар `(reminder_id, sent)`, где `sent` - признак успешной отправки.
+        now (float | None): Текущее время; пропущенные срабатывания до него не переносятся.
+        worker_id (str | None): Идентификатор процесса отправки; если указан, изменяются только
+            напоминания, аренда которых принадлежит этому процессу.
+
+    Возвращает:
+        list: Перенесенные повторяющиеся напоминания с новым временем (поля `id`, `phone_number`, `message_id`, `params`, `reminder_time`, `due_at`).
+    """
+    # Результат процесса, потерявшего аренду, не перезаписывает работу нового владельца
+    fence = " AND claimed_by = ?" if worker_id is not None else ""
+    fence_params = (worker_id,) if worker_id is not None else ()
+    rescheduled = []
+    with transaction(conn):
+        rules = {}
+        ids = [reminder_id for reminder_id, _ in results]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = conn.execute(
+                "SELECT id, phone_number, message_id, params, due_at, repeat_cron, repeat_every, repeat_until "
+                f"FROM reminders WHERE id IN ({','.join('?' * len(chunk))}) "
+                f"AND (repeat_cron IS NOT NULL OR repeat_every IS NOT NULL){fence}", (*chunk, *fence_params))
+            rules.update((row[0], row) for row in rows)
+
+        statuses = []
+        for reminder_id, sent in results:
+            row = rules.get(reminder_id)
+            if row is not None:
+                due_at = next_fire_time(row[4], row[5], row[6], now)
+                if due_at is not None and (row[7] is None or due_at <= due_timestamp(row[7])):
+                    reminder_time = format_timestamp(due_at)
+                    conn.execute("UPDATE reminders SET due_at = ?, reminder_time = ?, claimed_by = NULL, "
+                                 "lease_until = NULL WHERE id = ?", (due_at, reminder_time, reminder_id))
+                    rescheduled.append(_row_to_due_reminder((reminder_id, *row[1:4], reminder_time, due_at)))
+                    continue
+            statuses.append((STATUS_SENT if sent else STATUS_FAILED, reminder_id, *fence_params))
+        conn.executemany("UPDATE reminders SET status = ?, claimed_by = NULL, lease_until = NULL "
+                         f"WHERE id = ?{fence}", statuses)
+    return rescheduled
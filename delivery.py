@@ -0,0 +1,328 @@
+"""
+Модуль `delivery.py` реализует асинхронную доставку напоминаний через WhatsApp (Twilio).
+
+Основные классы:
+- `TokenBucket`: Ограничитель скорости по алгоритму "token bucket".
+- `TwilioSender`: Асинхронный отправитель сообщений поверх HTTP-клиента Twilio.
+- `DeliveryPipeline`: Конвейер доставки с ограничением параллелизма, скорости и повторами.
+
+Описание:
+    Конвейер работает в собственном потоке с отдельным циклом событий asyncio, поэтому
+    принимать напоминания (`submit`) можно из любого потока, например из диспетчера.
+    Одновременно выполняется не более `concurrency` запросов к Twilio, скорость отправки
+    с каждого номера отправителя ограничивается своим token bucket, а ответы 429 и 5xx,
+    а также сетевые ошибки повторяются с экспоненциальной задержкой.
+
+    Непосредственно перед каждой попыткой отправки вызывается `prepare(reminder)` (функция
+    или корутина), который может изменить сообщение или отменить отправку (например, если
+    напоминание удалено, пока сообщение ждало в очереди). Результат доставки сообщается обратным вызовом
+    `on_done(reminder, sent)`, который может быть корутиной и тогда выполняется в цикле
+    событий конвейера; отмененное сообщение считается неотправленным. Адрес API
+    задается параметром `api_url`, что позволяет направить отправку на локальный
+    тестовый сервер вместо `https://api.twilio.com`.
+
+Пример использования:
+    >>> sender = TwilioSender(ACCOUNT_SID, AUTH_TOKEN)
+    >>> pipeline = DeliveryPipeline(sender, FROM_NUMBER, on_done=lambda reminder, sent: None)
+    >>> pipeline.start()
+    >>> pipeline.submit({"id": 1, "phone_number": "+79123456789", "reminder_text": "Позвонить маме"})
+    >>> pipeline.stop()
+"""
+
+import asyncio
+import inspect
+import logging
+import random
+import threading
+import time
+
+import aiohttp
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+from logger import setup_logger
+from metrics import Counter, Gauge, Histogram
+
+logger = setup_logger("delivery_log", "delivery_logger")
+
+# HTTP-клиент Twilio пишет несколько строк уровня INFO на каждый запрос синхронно
+# в корневой логгер, поэтому его журнал ограничивается предупреждениями и ошибками
+twilio_http_logger = logging.getLogger("twilio.async_http_client")
+twilio_http_logger.setLevel(logging.WARNING)
+
+# Метрики обращений к Twilio и доставки
+TWILIO_REQUEST_DURATION = Histogram(
+    "reminders_twilio_request_duration_seconds", "Длительность запросов к Twilio")
+TWILIO_RESPONSES = Counter(
+    "reminders_twilio_responses_total", "Ответы Twilio по HTTP-статусам (error - сетевая ошибка)", ["status"])
+SENDS_IN_FLIGHT = Gauge(
+    "reminders_sends_in_flight", "Количество отправок в работе")
+DELIVERIES = Counter(
+    "reminders_deliveries_total", "Результаты доставки напоминаний", ["result"])
+
+# Статусы ответа, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DeliveryError(Exception):
+    """
+    Ошибка отправки сообщения через Twilio.
+
+    Атрибуты:
+        status (int | None): HTTP-статус ответа или None для сетевых ошибок.
+        retry_after (float | None): Рекомендованная сервером пауза перед повтором в секундах.
+    """
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """
+        Признак того, что запрос можно повторить.
+        """
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости: не более `rate` операций в секунду с запасом `burst`.
+
+    Атрибуты:
+        rate (float): Скорость пополнения токенов в секунду.
+        burst (float): Максимальное количество накопленных токенов.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Ожидает появления токена и забирает его.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TwilioSender:
+    """
+    Асинхронный отправитель сообщений WhatsApp через REST API Twilio.
+
+    Атрибуты:
+        account_sid (str): Идентификатор аккаунта Twilio.
+        auth_token (str): Токен аутентификации Twilio.
+        api_url (str): Базовый адрес API Twilio.
+        timeout (float): Таймаут одного запроса в секундах.
+    """
+
+    def __init__(self, account_sid, auth_token, api_url="https://api.twilio.com", timeout=10.0):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self._client = None
+
+    async def send(self, from_number, to_number, body):
+        """
+        Отправляет одно сообщение WhatsApp.
+
+        Параметры:
+            from_number (str): Номер отправителя.
+            to_number (str): Номер получателя.
+            body (str): Текст сообщения.
+
+        Исключения:
+            DeliveryError: Если Twilio вернул ошибку или запрос не удалось выполнить.
+        """
+        if self._client is None:
+            # Сессия aiohttp должна создаваться внутри работающего цикла событий
+            self._client = AsyncTwilioHttpClient()
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self._client.request(
+                    "POST",
+                    f"{self.api_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json",
+                    data={"From": f"whatsapp:{from_number}", "To": f"whatsapp:{to_number}", "Body": body},
+                    auth=(self.account_sid, self.auth_token),
+                ),
+                self.timeout,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            TWILIO_REQUEST_DURATION.observe(time.perf_counter() - started)
+            TWILIO_RESPONSES.labels("error").inc()
+            raise DeliveryError(f"Ошибка соединения с Twilio: {e!r}") from e
+        TWILIO_REQUEST_DURATION.observe(time.perf_counter() - started)
+        TWILIO_RESPONSES.labels(str(response.status_code)).inc()
+        if response.status_code >= 400:
+            retry_after = response.headers.get("Retry-After") if response.headers else None
+            raise DeliveryError(
+                f"Twilio вернул статус {response.status_code}: {response.text}",
+                status=response.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+
+    async def close(self):
+        """
+        Закрывает HTTP-сессию.
+        """
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class DeliveryPipeline:
+    """
+    Конвейер асинхронной доставки напоминаний.
+
+    Атрибуты:
+        sender: Отправитель с корутиной `send(from_number, to_number, body)`.
+        from_number (str): Номер отправителя.
+        on_done (callable): Обратный вызов или корутина `on_done(reminder, sent)` по завершении доставки.
+        prepare (callable | None): Функция или корутина, возвращающая сообщение для отправки или None для отмены отправки.
+        concurrency (int): Максимальное количество одновременных запросов.
+        rate (float): Допустимое количество сообщений в секунду с одного номера отправителя.
+        burst (float | None): Запас токенов для кратковременных всплесков.
+        max_retries (int): Максимальное количество повторов одного сообщения.
+        backoff_base (float): Базовая задержка экспоненциального повтора в секундах.
+        backoff_max (float): Максимальная задержка между повторами в секундах.
+    """
+
+    def __init__(self, sender, from_number, on_done, concurrency=50, rate=80.0, burst=None,
+                 max_retries=5, backoff_base=0.5, backoff_max=30.0, prepare=None):
+        self.sender = sender
+        self.from_number = from_number
+        self.on_done = on_done
+        self.prepare = prepare
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._buckets = {}
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """
+        Запускает поток с циклом событий и рабочими корутинами.
+        """
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name="reminder-delivery", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self, timeout=30.0):
+        """
+        Дожидается отправки уже принятых напоминаний и останавливает конвейер.
+
+        Параметры:
+            timeout (float): Максимальное время ожидания в секундах.
+        """
+        if self._thread is None:
+            return
+        for _ in range(self.concurrency):
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, reminder):
+        """
+        Принимает напоминание на отправку. Может вызываться из любого потока.
+
+        Параметры:
+            reminder (dict): Напоминание с полями `id`, `phone_number`, `reminder_text`
+                (для объединенного сообщения также список `ids`).
+        """
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, reminder)
+
+    def _bucket(self, from_number):
+        bucket = self._buckets.get(from_number)
+        if bucket is None:
+            bucket = self._buckets[from_number] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        await asyncio.gather(*workers)
+        close = getattr(self.sender, "close", None)
+        if close is not None:
+            await close()
+
+    async def _worker(self):
+        while True:
+            reminder = await self._queue.get()
+            if reminder is None:
+                return
+            SENDS_IN_FLIGHT.inc()
+            try:
+                sent = await self._deliver(reminder)
+            finally:
+                SENDS_IN_FLIGHT.dec()
+            DELIVERIES.labels("cancelled" if sent is None else "sent" if sent else "failed").inc()
+            try:
+                result = self.on_done(reminder, bool(sent))
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error("Ошибка обработки результата отправки %s - \n %s", reminder.get("id"), e)
+
+    async def _deliver(self, reminder):
+        """
+        Отправляет напоминание с учетом ограничения скорости и повторов.
+
+        Возвращает:
+            bool | None: Признак успешной отправки или None, если отправка отменена.
+        """
+        bucket = self._bucket(self.from_number)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                message = self.prepare(reminder) if self.prepare is not None else reminder
+                if inspect.isawaitable(message):
+                    message = await message
+                if message is None:
+                    logger.info("Отправка напоминания %s отменена", reminder.get("ids", reminder.get("id")))
+                    return None
+                await self.sender.send(self.from_number, message["phone_number"], message["reminder_text"])
+                logger.info("Напоминание %s отправлено на %s", reminder.get("ids", reminder.get("id")),
+                            reminder["phone_number"],
+                            extra={"sampled": True})
+                return True
+            except DeliveryError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    logger.error("Напоминание %s не отправлено - \n %s", reminder.get("id"), e)
+                    return False
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay = max(delay * random.uniform(0.5, 1.0), e.retry_after or 0)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error("Напоминание %s не отправлено - \n %s", reminder.get("id"), e)
+                return False
+        return False
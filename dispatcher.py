@@ -0,0 +1,501 @@
+"""
+Модуль `dispatcher.py` отвечает за своевременную отправку напоминаний из базы данных.
+
+Основные классы:
+- `Dispatcher`: Диспетчер, который держит в памяти только окно ближайших напоминаний.
+
+Основные функции:
+- `coalesce_reminders(reminders, max_length)`: Объединяет напоминания одного номера телефона в сообщения.
+- `without_reminders(message, reminder_ids)`: Убирает напоминания из сообщения перед отправкой.
+
+Описание:
+    Таблица `reminders` является единственным источником истины. Диспетчер хранит
+    в памяти кучу (heap) различных значений времени неотправленных напоминаний,
+    наступающих в пределах окна `window` секунд, и периодически дозаполняет ее запросом
+    по индексу времени. Благодаря этому потребление памяти не зависит ни от общего числа
+    ожидающих напоминаний, ни от количества напоминаний с одним временем, а восстановление
+    после перезапуска сводится к одному запросу: просроченные за время простоя напоминания
+    будут отправлены сразу.
+
+    Сама отправка выполняется внешним обработчиком `deliver(reminder)`, который должен
+    сообщить результат вызовом `Dispatcher.complete(reminder_id, sent)`.
+
+    Куча определяет только моменты пробуждения. Какие напоминания отправить, решает база:
+    когда время из кучи наступает, диспетчер атомарно захватывает в базе порцию
+    наступивших напоминаний с арендой на `lease` секунд (`claim_due_reminders`),
+    продлевает аренду, пока отправка не завершена, и записывает результат только для
+    своих аренд. Поэтому несколько процессов (воркеры uvicorn, реплики с общим файлом
+    базы) делят отправку без повторов, а каждый процесс захватывает не больше, чем
+    успевает отправить (`max_inflight`). Раз в `lease` секунд окно просматривается заново:
+    так находятся напоминания с истекшей арендой аварийно остановленных процессов.
+
+    После отправки повторяющегося напоминания его время переносится в базе на следующее
+    срабатывание, и оно снова попадает в окно.
+
+    При `coalesce_window > 0` диспетчер объединяет напоминания одного получателя: вместе
+    с наступившим напоминанием захватываются напоминания того же номера телефона, время
+    которых наступает в пределах `coalesce_window` секунд, и отправляются одним сообщением
+    длиной не более `max_message_length` символов. Объединенное сообщение содержит список
+    `ids`, и результат его отправки должен быть сообщен для каждого ID из списка.
+
+    Захваченные напоминания содержат ссылку на текст `message_id` и параметры шаблона,
+    а текст `reminder_text` заполняется непосредственно перед отправкой через
+    `MessageRenderer` с LRU-кэшем на `message_cache_size` отрисованных текстов (см. модуль
+    `messages.py`), поэтому память диспетчера не зависит от длины текстов.
+
+    Удаленные напоминания не могут быть захвачены. Уже захваченные могут быть удалены
+    любым процессом, а после истечения аренды - захвачены другим процессом, поэтому
+    конвейер доставки непосредственно перед отправкой вызывает `Dispatcher.prepare(message)`.
+    Он проверяет в базе, что напоминания еще существуют и захвачены этим процессом, и
+    отменяет сообщение или убирает из объединенного сообщения остальные тексты. Вызов
+    `Dispatcher.cancel(reminder_ids)` в процессе, удалившем напоминания, отменяет их
+    отправку без обращения к базе.
+
+Пример использования:
+    >>> dispatcher = Dispatcher("reminders.db", deliver=my_deliver)
+    >>> dispatcher.start()
+    >>> dispatcher.notify({"id": 1, "phone_number": "+79123456789", "reminder_text": "Позвонить маме",
+    ...                    "reminder_time": "2023-10-01 12:00:00", "due_at": 1696150800})
+    >>> dispatcher.stop()
+"""
+
+import heapq
+import os
+import socket
+import threading
+import time
+import uuid
+
+from database import (
+    claim_due_reminders,
+    connect,
+    count_due_reminders,
+    get_claimed_ids,
+    get_connection,
+    get_due_times,
+    mark_reminders,
+    renew_claims
+)
+from logger import setup_logger
+from messages import MessageRenderer
+from metrics import Counter, Histogram
+
+logger = setup_logger("dispatcher_log", "dispatcher_logger")
+
+# Задержка передачи напоминания на отправку относительно его времени
+DISPATCH_LAG = Histogram(
+    "reminders_dispatch_lag_seconds", "Задержка передачи напоминания на отправку относительно его времени",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0))
+
+# Количество сообщений, переданных на отправку, и напоминаний в них
+DISPATCHED_MESSAGES = Counter(
+    "reminders_dispatched_messages_total", "Количество сообщений, переданных на отправку")
+DISPATCHED_REMINDERS = Counter(
+    "reminders_dispatched_total", "Количество напоминаний, переданных на отправку (с учетом объединения)")
+
+# Разделитель текстов объединенных напоминаний
+COALESCE_SEPARATOR = "\n\n"
+
+
+def coalesce_reminders(reminders, max_length=1600):
+    """
+    Объединяет напоминания в сообщения по номеру телефона с ограничением длины текста.
+
+    Тексты одного получателя объединяются в порядке времени напоминаний; если очередной
+    текст не помещается в `max_length` символов, начинается новое сообщение.
+
+    Параметры:
+        reminders (list): Напоминания с полями `id`, `phone_number`, `reminder_text`, `due_at`.
+        max_length (int): Максимальная длина текста одного сообщения.
+
+    Возвращает:
+        list: Сообщения с полями напоминаний, списком `ids` вошедших в них напоминаний
+            и их текстами `texts`.
+    """
+    by_phone = {}
+    for reminder in sorted(reminders, key=lambda item: (item["due_at"], item["id"])):
+        by_phone.setdefault(reminder["phone_number"], []).append(reminder)
+
+    messages = []
+    for group in by_phone.values():
+        message = None
+        for reminder in group:
+            text = reminder["reminder_text"]
+            if message is not None and \
+                    len(message["reminder_text"]) + len(COALESCE_SEPARATOR) + len(text) <= max_length:
+                message["reminder_text"] += COALESCE_SEPARATOR + text
+                message["ids"].append(reminder["id"])
+                message["texts"].append(text)
+                continue
+            message = {**reminder, "ids": [reminder["id"]], "texts": [text]}
+            messages.append(message)
+    return messages
+
+def without_reminders(message, reminder_ids):
+    """
+    Убирает из сообщения напоминания, например удаленные после захвата.
+
+    Параметры:
+        message (dict): Сообщение, полученное от `coalesce_reminders`, или одиночное напоминание.
+        reminder_ids (set): ID напоминаний, которые не нужно отправлять.
+
+    Возвращает:
+        dict | None: Сообщение с текстами остальных напоминаний или None, если не осталось ни одного.
+    """
+    if not reminder_ids:
+        return message
+    if "ids" not in message:
+        return None if message["id"] in reminder_ids else message
+    kept = [(reminder_id, text) for reminder_id, text in zip(message["ids"], message["texts"])
+            if reminder_id not in reminder_ids]
+    if not kept:
+        return None
+    return {**message, "id": kept[0][0], "ids": [reminder_id for reminder_id, _ in kept],
+            "texts": [text for _, text in kept], "reminder_text": COALESCE_SEPARATOR.join(text for _, text in kept)}
+
+
+class Dispatcher:
+    """
+    Диспетчер отправки напоминаний со скользящим окном.
+
+    Атрибуты:
+        db_path (str): Путь к файлу базы данных.
+        deliver (callable): Обработчик отправки, принимает словарь напоминания.
+        window (float): Ширина окна в секундах, на которое напоминания загружаются в память.
+        batch_size (int): Максимальное количество значений времени за один запрос дозаполнения.
+        poll_interval (float): Максимальная пауза между проверками базы в секундах.
+        clock (callable): Источник текущего времени в секундах эпохи.
+        coalesce_window (float): Окно объединения напоминаний одного получателя в секундах (0 - без объединения).
+        max_message_length (int): Максимальная длина текста объединенного сообщения.
+        worker_id (str | None): Идентификатор процесса для захвата напоминаний; по умолчанию хост, PID и случайный суффикс.
+        lease (float): Срок аренды захваченных напоминаний в секундах.
+        claim_batch (int): Максимальное количество напоминаний, захватываемых одним запросом.
+        max_inflight (int): Максимальное количество захваченных, но еще не отправленных напоминаний.
+        renderer (MessageRenderer): Отрисовка текстов захваченных напоминаний с кэшем на `message_cache_size` текстов.
+    """
+
+    def __init__(self, db_path, deliver, window=300, batch_size=1000, poll_interval=5.0, clock=time.time,
+                 coalesce_window=0.0, max_message_length=1600, worker_id=None, lease=60.0, claim_batch=200,
+                 max_inflight=1000, message_cache_size=1024):
+        self.db_path = db_path
+        self.deliver = deliver
+        self.window = window
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.coalesce_window = coalesce_window
+        self.max_message_length = max_message_length
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease = lease
+        self.claim_batch = claim_batch
+        self.max_inflight = max_inflight
+        self.renderer = MessageRenderer(message_cache_size)
+
+        self._heap = []
+        self._due_times = set()
+        self._inflight = set()
+        self._cancelled_inflight = set()
+        self._cursor = None
+        self._completed = []
+        self._backlog = True
+        self._next_rescan = 0.0
+        self._next_renew = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+        return self._conn
+
+    def start(self):
+        """
+        Запускает фоновый поток диспетчера.
+        """
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="reminder-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Останавливает фоновый поток и сохраняет накопленные результаты отправки.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def notify(self, reminder):
+        """
+        Сообщает диспетчеру о новом напоминании, сохраненном в базе данных.
+
+        Время напоминания, попадающего в текущее окно, сразу помещается в кучу; остальные
+        напоминания будут найдены в базе, когда окно до них дойдет.
+
+        Параметры:
+            reminder (dict): Напоминание с полями `id`, `phone_number`, `reminder_text`, `due_at`.
+        """
+        if reminder["due_at"] > self.clock() + self.window:
+            return
+        with self._lock:
+            self._push(reminder["due_at"])
+        self._wakeup.set()
+
+    def notify_many(self, reminders):
+        """
+        Сообщает диспетчеру о пачке новых напоминаний за одну блокировку.
+
+        Параметры:
+            reminders (list): Напоминания с полями `id`, `phone_number`, `reminder_text`, `due_at`.
+        """
+        horizon = self.clock() + self.window
+        with self._lock:
+            for reminder in reminders:
+                if reminder["due_at"] <= horizon:
+                    self._push(reminder["due_at"])
+        self._wakeup.set()
+
+    def complete(self, reminder_id, sent):
+        """
+        Фиксирует результат отправки напоминания. Может вызываться из любого потока.
+
+        Параметры:
+            reminder_id (int): ID напоминания.
+            sent (bool): Признак успешной отправки.
+        """
+        with self._lock:
+            self._completed.append((reminder_id, sent))
+        self._wakeup.set()
+
+    def cancel(self, reminder_ids):
+        """
+        Снимает с отправки удаленные напоминания.
+
+        Еще не захваченные напоминания удалены из базы и захвачены не будут, а уже
+        захваченные этим процессом убираются из сообщений при вызове `prepare` перед
+        отправкой без обращения к базе.
+
+        Параметры:
+            reminder_ids (iterable): ID удаленных напоминаний.
+        """
+        with self._lock:
+            for reminder_id in reminder_ids:
+                if reminder_id in self._inflight:
+                    self._cancelled_inflight.add(reminder_id)
+
+    def cancelled_ids(self, reminder_ids):
+        """
+        Возвращает ID захваченных напоминаний, которые больше нельзя отправлять.
+
+        Напоминание нельзя отправлять, если оно удалено (в этом или другом процессе),
+        уже отмечено отправленным или после истечения аренды захвачено другим процессом.
+        Выполняет запрос к базе данных и может вызываться из любого потока.
+
+        Параметры:
+            reminder_ids (iterable): ID проверяемых напоминаний.
+
+        Возвращает:
+            set: ID напоминаний из `reminder_ids`, отправку которых нужно отменить.
+        """
+        reminder_ids = list(reminder_ids)
+        with self._lock:
+            cancelled = self._cancelled_inflight.intersection(reminder_ids)
+        remaining = [reminder_id for reminder_id in reminder_ids if reminder_id not in cancelled]
+        if remaining:
+            claimed = get_claimed_ids(get_connection(self.db_path), remaining, self.worker_id)
+            cancelled.update(reminder_id for reminder_id in remaining if reminder_id not in claimed)
+        return cancelled
+
+    def prepare(self, message):
+        """
+        Убирает из сообщения напоминания, удаленные или захваченные другим процессом после
+        захвата. Вызывается конвейером доставки непосредственно перед отправкой из любого
+        потока; выполняет запрос к базе данных.
+
+        Параметры:
+            message (dict): Сообщение, переданное обработчику `deliver`.
+
+        Возвращает:
+            dict | None: Сообщение для отправки или None, если не осталось ни одного напоминания.
+        """
+        return without_reminders(message, self.cancelled_ids(message.get("ids", [message["id"]])))
+
+    def stats(self):
+        """
+        Возвращает состояние очереди диспетчера.
+
+        Возвращает:
+            dict: Количество различных значений времени в окне (`due_times`), напоминаний,
+            переданных на отправку (`inflight`), и время ближайшего напоминания
+            в секундах эпохи (`next_due_at`).
+        """
+        with self._lock:
+            return {
+                "due_times": len(self._heap),
+                "inflight": len(self._inflight),
+                "next_due_at": self._heap[0] if self._heap else None,
+            }
+
+    def due_count(self):
+        """
+        Возвращает количество неотправленных напоминаний в окне, включая просроченные.
+
+        Куча хранит только различные значения времени, поэтому количество напоминаний
+        подсчитывается в базе по индексу времени. Может вызываться из любого потока.
+
+        Возвращает:
+            int: Количество напоминаний со временем не позже конца окна.
+        """
+        return count_due_reminders(get_connection(self.db_path), int(self.clock() + self.window))
+
+    def _push(self, due_at):
+        # Куча хранит одну запись на значение времени, сколько бы напоминаний его ни имели
+        if due_at in self._due_times:
+            return
+        self._due_times.add(due_at)
+        heapq.heappush(self._heap, due_at)
+
+    def _refill(self, now):
+        """
+        Дозаполняет окно различными значениями времени напоминаний из базы данных.
+        """
+        until = int(now + self.window)
+        conn = self._connection()
+        while True:
+            times = get_due_times(conn, self._cursor, until, self.batch_size)
+            with self._lock:
+                for due_at in times:
+                    self._push(due_at)
+            if times:
+                self._cursor = times[-1]
+            if len(times) < self.batch_size:
+                break
+
+    def flush(self):
+        """
+        Сохраняет в базу данных накопленные результаты отправки.
+
+        Повторяющиеся напоминания, следующее срабатывание которых попадает в текущее окно,
+        сразу возвращают свое время в кучу: курсор дозаполнения мог уже пройти их новое время.
+        """
+        with self._lock:
+            completed, self._completed = self._completed, []
+            for reminder_id, _ in completed:
+                self._inflight.discard(reminder_id)
+                self._cancelled_inflight.discard(reminder_id)
+        if completed:
+            now = self.clock()
+            rescheduled = mark_reminders(self._connection(), completed, now, self.worker_id)
+            with self._lock:
+                for reminder in rescheduled:
+                    if reminder["due_at"] <= now + self.window:
+                        self._push(reminder["due_at"])
+
+    def _renew(self, now):
+        """
+        Продлевает аренду напоминаний, отправка которых еще не завершена.
+        """
+        if now < self._next_renew:
+            return
+        self._next_renew = now + self.lease / 3
+        with self._lock:
+            inflight = list(self._inflight)
+        if inflight:
+            renew_claims(self._connection(), inflight, self.worker_id, now + self.lease)
+
+    def _claim(self, now):
+        """
+        Захватывает в базе данных наступившие напоминания в пределах свободной емкости.
+
+        Возвращает:
+            list: Захваченные напоминания.
+        """
+        with self._lock:
+            capacity = self.max_inflight - len(self._inflight)
+        if capacity <= 0:
+            return []
+        limit = min(capacity, self.claim_batch)
+        conn = self._connection()
+        claimed = claim_due_reminders(conn, self.worker_id, now, now, now + self.lease, limit)
+        # Если захвачена полная порция, в базе могут оставаться наступившие напоминания
+        self._backlog = len(claimed) == limit
+        # Напоминания для объединения захватываются только в пределах оставшейся емкости
+        if claimed and self.coalesce_window > 0 and capacity > len(claimed):
+            claimed.extend(claim_due_reminders(
+                conn, self.worker_id, now + self.coalesce_window, now, now + self.lease, capacity - len(claimed),
+                phone_numbers={reminder["phone_number"] for reminder in claimed}))
+        with self._lock:
+            self._inflight.update(reminder["id"] for reminder in claimed)
+        return claimed
+
+    def run_once(self):
+        """
+        Выполняет один цикл диспетчера: сохраняет результаты отправки, дозаполняет окно,
+        захватывает в базе наступившие напоминания и передает их обработчику.
+
+        Возвращает:
+            float: Пауза в секундах до следующего цикла.
+        """
+        self.flush()
+        now = self.clock()
+        if now >= self._next_rescan:
+            # Периодический повторный просмотр окна находит напоминания с истекшей арендой
+            # и напоминания, перенесенные другими процессами раньше курсора
+            self._cursor = None
+            self._backlog = True
+            self._next_rescan = now + self.lease
+        self._refill(now)
+        self._renew(now)
+
+        with self._lock:
+            while self._heap and self._heap[0] <= now:
+                self._due_times.discard(heapq.heappop(self._heap))
+                self._backlog = True
+            next_time = self._heap[0] if self._heap else None
+
+        due = self._claim(now) if self._backlog else []
+        for reminder in due:
+            DISPATCH_LAG.observe(max(0.0, now - reminder["due_at"]))
+        failed = self.renderer.render(self._connection(), due) if due else []
+        if failed:
+            failed_ids = {reminder["id"] for reminder in failed}
+            for reminder_id in failed_ids:
+                logger.error("Текст напоминания %s не найден в базе данных", reminder_id)
+                self.complete(reminder_id, False)
+            due = [reminder for reminder in due if reminder["id"] not in failed_ids]
+        messages = coalesce_reminders(due, self.max_message_length) if self.coalesce_window > 0 else due
+        DISPATCHED_MESSAGES.inc(len(messages))
+        DISPATCHED_REMINDERS.inc(len(due))
+
+        for message in messages:
+            try:
+                self.deliver(message)
+            except Exception as e:
+                logger.error("Ошибка передачи напоминания %s на отправку - \n %s", message["id"], e)
+                for reminder_id in message.get("ids", [message["id"]]):
+                    self.complete(reminder_id, False)
+
+        with self._lock:
+            has_capacity = len(self._inflight) < self.max_inflight
+        if self._backlog and has_capacity:
+            return 0.0
+        wakeups = [self._next_rescan, self._next_renew if self._inflight else self._next_rescan]
+        if next_time is not None:
+            wakeups.append(next_time)
+        delay = min(wakeups) - self.clock()
+        return min(max(delay, 0), self.poll_interval)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                logger.error("Ошибка в цикле диспетчера - \n %s", e)
+                delay = self.poll_interval
+            self._wakeup.wait(delay)
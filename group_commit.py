@@ -0,0 +1,199 @@
+"""
+Модуль `group_commit.py` реализует групповую фиксацию (group commit) записей напоминаний.
+
+Основные классы:
+- `GroupCommitWriter`: Поток записи, объединяющий вставки параллельных запросов в одну транзакцию.
+
+Описание:
+    Каждая фиксация транзакции SQLite - это синхронизация с диском, и при одиночных
+    вставках именно она определяет задержку `POST /reminder/`. Писатель собирает вставки
+    от параллельных запросов в течение не более `max_delay` секунд или до `max_rows` строк,
+    сохраняет их одной транзакцией и только после фиксации возвращает каждому запросу
+    ID его напоминания.
+
+    Соединение писателя работает с `PRAGMA synchronous=FULL`: в режиме WAL с уровнем
+    `NORMAL`, который используют остальные соединения, фиксация не синхронизирует журнал
+    с диском, и после сбоя питания подтвержденная вставка могла бы пропасть. С `FULL`
+    запрос получает ID только после того, как пачка записана на диск, а одна
+    синхронизация приходится на всю пачку.
+
+    Если транзакция пачки завершается ошибкой, строки сохраняются по одной, чтобы ошибка
+    одной строки не затронула остальные запросы.
+
+    Размер пачек и длительность их записи с фиксацией записываются в гистограммы
+    `reminders_group_commit_batch_size` и `reminders_group_commit_flush_duration_seconds`,
+    а метод `stats()` возвращает настройки писателя и длину очереди.
+
+Пример использования:
+    >>> writer = GroupCommitWriter("reminders.db", max_delay=0.005, max_rows=500)
+    >>> writer.start()
+    >>> reminder_id = await writer.submit({"phone_number": "+79123456789", "reminder_text": "Позвонить маме",
+    ...                                     "reminder_time": "2023-10-01 12:00:00", "due_at": 1696150800})
+    >>> writer.stop()
+"""
+
+import asyncio
+import queue
+import threading
+import time
+
+from database import connect, save_reminders
+from logger import setup_logger
+from metrics import Histogram
+
+logger = setup_logger("group_commit_log", "group_commit_logger")
+
+# Количество строк в пачках групповой фиксации
+BATCH_SIZE = Histogram(
+    "reminders_group_commit_batch_size", "Количество строк в пачке групповой фиксации",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+# Длительность записи и фиксации пачки
+FLUSH_DURATION = Histogram(
+    "reminders_group_commit_flush_duration_seconds", "Длительность записи и фиксации пачки групповой фиксации")
+
+
+def _resolve(future, result=None, error=None):
+    """
+    Завершает future запроса, если клиент еще ожидает результат.
+    """
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class GroupCommitWriter:
+    """
+    Поток групповой фиксации вставок напоминаний.
+
+    Атрибуты:
+        db_path (str): Путь к файлу базы данных.
+        max_delay (float): Максимальное время накопления пачки в секундах.
+        max_rows (int): Максимальное количество строк в пачке.
+    """
+
+    def __init__(self, db_path, max_delay=0.005, max_rows=500):
+        self.db_path = db_path
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """
+        Запускает поток записи.
+        """
+        self._thread = threading.Thread(target=self._run, name="reminder-group-commit", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Сохраняет уже принятые вставки и останавливает поток записи.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    async def submit(self, reminder):
+        """
+        Ставит напоминание в очередь на запись и ожидает фиксации его пачки.
+
+        Параметры:
+            reminder (dict): Напоминание с полями `phone_number`, `reminder_text`, `reminder_time`, `due_at`.
+
+        Возвращает:
+            int: ID сохраненного напоминания.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((reminder, loop, future))
+        return await future
+
+    def stats(self):
+        """
+        Возвращает настройки групповой фиксации и длину очереди.
+
+        Возвращает:
+            dict: Настройки `max_delay_ms`, `max_rows` и количество ожидающих вставок `queued`.
+        """
+        return {
+            "max_delay_ms": self.max_delay * 1000,
+            "max_rows": self.max_rows,
+            "queued": self._queue.qsize(),
+        }
+
+    def _collect(self, first):
+        """
+        Собирает пачку, начиная с `first`, пока не истечет `max_delay` или не наберется `max_rows`.
+
+        Возвращает:
+            tuple: Пачка и признак получения сигнала остановки.
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_rows:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, conn, batch):
+        """
+        Сохраняет пачку одной транзакцией и сообщает запросам их ID.
+        """
+        started = time.perf_counter()
+        try:
+            ids = save_reminders(conn, [reminder for reminder, _, _ in batch])
+            results = [(reminder_id, None) for reminder_id in ids]
+        except Exception as e:
+            logger.error("Ошибка групповой записи %s напоминаний, запись по одной - \n %s", len(batch), e)
+            results = []
+            for reminder, _, _ in batch:
+                try:
+                    results.append((save_reminders(conn, [reminder])[0], None))
+                except Exception as row_error:
+                    results.append((None, row_error))
+        elapsed = time.perf_counter() - started
+
+        for (_, loop, future), (reminder_id, error) in zip(batch, results):
+            loop.call_soon_threadsafe(_resolve, future, reminder_id, error)
+
+        BATCH_SIZE.observe(len(batch))
+        FLUSH_DURATION.observe(elapsed)
+
+    def _run(self):
+        conn = connect(self.db_path)
+        # ID возвращается запросу только после синхронизации пачки с диском
+        conn.execute("PRAGMA synchronous=FULL")
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stopping = self._collect(first)
+                self._write(conn, batch)
+            # Вставки, принятые до сигнала остановки, сохраняются последней пачкой
+            rest = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    rest.append(item)
+            if rest:
+                self._write(conn, rest)
+        finally:
+            conn.close()
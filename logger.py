@@ -2,7 +2,8 @@
 Модуль `logger.py` предназначен для настройки и управления логированием в приложении.
 
 Основная функция:
-- `setup_logger(name_file, name_logger)`: Настраивает логгер с ротацией файлов.
+- `setup_logger(name_file, name_logger, mode)`: Настраивает логгер с ротацией файлов.
+- `shutdown_logging()`: Дописывает накопленные записи и останавливает фоновые потоки записи.
 
 Описание:
     Этот модуль позволяет создавать логгеры, которые
@@ -10,23 +11,203 @@
     и автоматической ротацией. Логи сохраняются в папке `logs`,
     а старые файлы архивируются.
 
+    Поддерживаются два режима (`LOG_MODE`):
+    - `queue` (по умолчанию): логгер только помещает запись в очередь, а фоновый поток
+      забирает записи пачками и дописывает их в файл одной операцией в виде JSON-строк.
+      Запись лога не выполняет файловых операций ни в цикле событий, ни в потоках отправки.
+    - `sync`: прежний режим с синхронной записью текстовых строк в файл.
+
+    Записи успешных операций с большим потоком можно помечать `extra={"sampled": True}`:
+    в файл попадает только доля `LOG_SAMPLE_RATE` таких записей.
+
+    Логгеры и файлы хранятся в реестре: повторный вызов `setup_logger` с тем же именем
+    возвращает уже настроенный логгер, а несколько логгеров с одним файлом используют
+    общий обработчик, поэтому обработчики не дублируются.
+
 Пример использования:
     >>> from logger import setup_logger
     >>> logger = setup_logger("my_app_log", "my_app_logger")
     >>> logger.info("Это тестовое сообщение.")
+    >>> logger.info("Сообщение отправлено", extra={"sampled": True})
 """
 
+import atexit
+import datetime
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+from config import LOG_MODE, LOG_SAMPLE_RATE
+
+# Установка размера файла логов в 8 МБ
+MAX_BYTES = 8 * 1024 * 1024  # 8 МБ в байтах
+
+# Количество файлов логов, которые будут храниться
+BACKUP_COUNT = 30
+
+# Максимальное количество записей, записываемых в файл одной операцией
+BATCH_SIZE = 500
+
+# Реестр настроенных логгеров и обработчиков файлов
+_loggers = {}
+_file_handlers = {}
+_registry_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю `rate` записей, помеченных `extra={"sampled": True}`.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись лога в одну JSON-строку.
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _PreparedQueueHandler(QueueHandler):
+    """
+    Обработчик очереди, который переносит в запись только готовый текст сообщения.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BatchFileWriter:
+    """
+    Фоновый поток, дописывающий записи из очереди в файл с ротацией пачками.
 
-def setup_logger(name_file, name_logger):
+    Атрибуты:
+        path (str): Путь к файлу логов.
+        queue (queue.SimpleQueue): Очередь записей.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, batch_size=BATCH_SIZE):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.batch_size = batch_size
+        self._formatter = JsonFormatter()
+        # Обработчик используется только для управления файлом и ротацией
+        self._file = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                         encoding="utf-8", delay=True)
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def _write(self, records):
+        text = "".join(self._formatter.format(record) + "\n" for record in records)
+        handler = self._file
+        with handler.lock:
+            if handler.stream is None:
+                handler.stream = handler._open()
+            # Размер файла считается в байтах, а не в символах
+            size = len(text.encode(handler.encoding or "utf-8"))
+            if handler.maxBytes and handler.stream.tell() + size >= handler.maxBytes:
+                handler.doRollover()
+                # При `delay=True` ротация не открывает новый файл
+                if handler.stream is None:
+                    handler.stream = handler._open()
+            handler.stream.write(text)
+            handler.stream.flush()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in records:
+                stopping = True
+                records = [record for record in records if record is not None]
+            try:
+                self._write(records)
+            except Exception:
+                # Ошибка записи лога не должна останавливать поток, но выводится в stderr
+                if records:
+                    self._file.handleError(records[0])
+
+    def stop(self):
+        """
+        Дописывает оставшиеся записи и останавливает поток.
+        """
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+        self._file.close()
+
+
+def _file_handler(name_file, mode):
+    """
+    Возвращает общий для всех логгеров обработчик файла `logs/<name_file>.log`.
+    """
+    key = (name_file, mode)
+    handler = _file_handlers.get(key)
+    if handler is not None:
+        return handler
+
+    path = f"logs/{name_file}.log"
+    if mode == "queue":
+        writer = BatchFileWriter(path)
+        handler = _PreparedQueueHandler(writer.queue)
+        handler.writer = writer
+    else:
+        # Создание обработчика файлов с ограничением размера и ротацией
+        handler = RotatingFileHandler(
+            path,  # Путь к файлу логов
+            maxBytes=MAX_BYTES,  # Максимальный размер файла логов
+            backupCount=BACKUP_COUNT,  # Количество файлов логов, которые будут храниться
+            encoding="utf-8",  # Кодировка файла
+        )
+        # Формат сообщений
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    _file_handlers[key] = handler
+    return handler
+
+
+def setup_logger(name_file, name_logger, mode=None):
     """
     Настраивает и возвращает логгер с ротацией файлов.
 
     Параметры:
         name_file (str): Имя файла для логов (без расширения). Файл будет создан в папке `logs`.
         name_logger (str): Имя логгера, которое будет отображаться в логах.
+        mode (str | None): Режим записи `queue` или `sync`; по умолчанию `LOG_MODE`.
 
     Возвращает:
         logging.Logger: Настроенный логгер.
@@ -35,30 +216,39 @@ def setup_logger(name_file, name_logger):
         logger = setup_logger("parser_main_log", "parser_main_logger")
         logger.info("Это тестовое сообщение.")
     """
-    logs_dir = "logs"
-    if not os.path.exists(logs_dir):
-        os.makedirs(logs_dir)
-
-    # Настройка базовой конфигурации логирования
-    logging.basicConfig(level=logging.INFO)
+    mode = mode or LOG_MODE
+    with _registry_lock:
+        logger = _loggers.get(name_logger)
+        if logger is not None:
+            return logger
 
-    # Установка размера файла логов в 8 МБ
-    max_bytes = 8 * 1024 * 1024  # 8 МБ в байтах
+        logs_dir = "logs"
+        if not os.path.exists(logs_dir):
+            os.makedirs(logs_dir)
 
-    # Создание обработчика файлов с ограничением размера и ротацией
-    file_handler = RotatingFileHandler(
-        f"logs/{name_file}.log",  # Путь к файлу логов
-        maxBytes=max_bytes,  # Максимальный размер файла логов
-        backupCount=30,  # Количество файлов логов, которые будут храниться
-        encoding="utf-8",  # Кодировка файла
-    )
+        # Настройка базовой конфигурации логирования
+        logging.basicConfig(level=logging.INFO)
 
-    # Формат сообщений
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    file_handler.setFormatter(formatter)
+        # Создание и настройка логгера
+        logger = logging.getLogger(f'{name_logger}')
+        logger.addHandler(_file_handler(name_file, mode))
+        if mode == "queue":
+            # В режиме очереди запись не дублируется синхронным выводом корневого логгера
+            logger.propagate = False
+        _loggers[name_logger] = logger
+        return logger
 
-    # Создание и настройка логгера
-    logger = logging.getLogger(f'{name_logger}')
-    logger.addHandler(file_handler)
 
-    return logger
+@atexit.register
+def shutdown_logging():
+    """
+    Дописывает накопленные записи и останавливает фоновые потоки записи логов.
+    """
+    with _registry_lock:
+        handlers = list(_file_handlers.values())
+        _file_handlers.clear()
+        _loggers.clear()
+    for handler in handlers:
+        writer = getattr(handler, "writer", None)
+        if writer is not None:
+            writer.stop()
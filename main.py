@@ -2,15 +2,29 @@
 Модуль `main.py` является основным модулем приложения для управления напоминаниями.
 
 Основные функции:
-- `send_reminder(phone_number: str, reminder_text: str)`: Отправляет напоминание через WhatsApp.
+- `deliver_reminder(reminder: dict)`: Передает наступившее напоминание в конвейер доставки WhatsApp.
 - `create_reminder(reminder: Reminder)`: Создает и сохраняет напоминание в базе данных.
-- `get_reminders(phone_number: str)`: Возвращает все напоминания для указанного номера телефона.
+- `import_reminders(request: Request)`: Массово создает напоминания из потока NDJSON или CSV.
+- `get_reminders(phone_number: str, ...)`: Возвращает напоминания номера телефона постранично или потоком NDJSON.
 - `get_reminder(reminder_id: int, phone_number: str):`: Возвращает напоминание по id для указанного номера телефона.
-- `delete_reminder(reminder_id: int)`: Удаляет напоминание по его ID.
+- `delete_reminder(reminder_id: int)`: Удаляет напоминание по его ID и снимает его с отправки.
+- `delete_reminders(...)`: Удаляет напоминания по номеру телефона и/или диапазону времени.
+- `get_metrics()`: Возвращает метрики приложения в формате Prometheus.
 
 Описание:
-    Этот модуль использует FastAPI для создания REST API, Twilio для отправки сообщений
-    и APScheduler для планирования напоминаний. Логирование осуществляется через модуль `logger.py`.
+    Этот модуль использует FastAPI для создания REST API и асинхронный конвейер доставки
+    из модуля `delivery.py` для отправки сообщений через Twilio.
+    Планирование выполняет диспетчер из модуля `dispatcher.py`, который читает наступающие
+    напоминания из базы данных, поэтому ожидающие напоминания переживают перезапуск приложения.
+    Диспетчер захватывает напоминания в базе с арендой, поэтому приложение можно запускать
+    в нескольких процессах (`uvicorn --workers N` или несколько контейнеров с общим файлом базы).
+    При `SHARD_COUNT > 1` напоминания распределяются по нескольким файлам SQLite по номеру
+    телефона (модуль `sharding.py`), у каждого шарда свои писатель, диспетчер и задача хранения.
+    Одиночные вставки объединяются в общие транзакции писателем из модуля `group_commit.py`.
+    Запросы чтения обслуживаются через кэш из модуля `cache.py`, который сбрасывается
+    при создании, удалении и отправке напоминаний. Старые обработанные напоминания переносятся
+    в архив фоновой задачей из модуля `retention.py`. Метрики (`/metrics`) собираются модулем
+    `metrics.py`. Логирование осуществляется через модуль `logger.py`.
 
 Пример использования:
     Запуск приложения:
@@ -21,57 +35,182 @@
     >>> Body: {"phone_number": "+79123456789", "reminder_text": "Позвонить маме", "reminder_time": "2023-10-01 12:00:00"}
 """
 
+import asyncio
 import datetime
+import json
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from twilio.rest import Client
-from apscheduler.schedulers.background import BackgroundScheduler
-
-from database import (
-    create_database,
-    delete_reminder_by_id,
-    get_reminders_by_phone_number,
-    save_reminder,
-    get_reminder_by_id_for_phone
-)
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from database import DATABASE_PATH, STATUS_NAMES, TIME_FORMAT, format_timestamp
 from logger import setup_logger
-from config import ACCOUNT_SID, AUTH_TOKEN, FROM_NUMBER
+from bulk_import import iter_records
+from cache import create_cache
+from config import (
+    ACCOUNT_SID,
+    AUTH_TOKEN,
+    BULK_CHUNK_SIZE,
+    CACHE_BACKEND,
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL,
+    CACHE_URL,
+    COALESCE_WINDOW,
+    DISPATCH_CLAIM_BATCH,
+    DISPATCH_LEASE,
+    DISPATCH_MAX_INFLIGHT,
+    FROM_NUMBER,
+    GROUP_COMMIT_MAX_DELAY_MS,
+    GROUP_COMMIT_MAX_ROWS,
+    MAX_MESSAGE_LENGTH,
+    MESSAGE_CACHE_SIZE,
+    RETENTION_ARCHIVE,
+    RETENTION_BATCH_SIZE,
+    RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    SEND_BURST,
+    SEND_CONCURRENCY,
+    SEND_MAX_RETRIES,
+    SEND_RATE,
+    SHARD_COUNT,
+    TWILIO_API_URL,
+    WORKER_ID
+)
+from delivery import DeliveryPipeline, TwilioSender
+from metrics import GaugeCallback, MetricsMiddleware, render as render_metrics
 from models import Reminder
-
-# Инициализация FastAPI
-app = FastAPI()
+from recurrence import first_fire_time
+from retention import RetentionWorker
+from sharding import ShardedDispatcher, ShardedStore, ShardedWriter
 
 # Инициализация логгера
 logger = setup_logger("main_log", "main_logger")
 
-# Инициализация клиента Twilio
-client = Client(ACCOUNT_SID, AUTH_TOKEN)
+# Хранилище напоминаний (один файл или несколько шардов), создание баз и миграция схемы
+store = ShardedStore(DATABASE_PATH, SHARD_COUNT)
+store.create_databases()
 
-# Инициализация планировщика
-scheduler = BackgroundScheduler()
-scheduler.start()
+# Инициализация писателей с групповой фиксацией (по одному на шард)
+writer = ShardedWriter(
+    store,
+    max_delay=GROUP_COMMIT_MAX_DELAY_MS / 1000,
+    max_rows=GROUP_COMMIT_MAX_ROWS
+)
 
-# Создание базы данных
-CONN, C = create_database()
+# Инициализация кэша чтения
+cache = create_cache(CACHE_BACKEND, CACHE_URL, CACHE_MAX_ENTRIES, CACHE_TTL)
 
-def send_reminder(phone_number: str, reminder_text: str):
+async def on_delivered(reminder: dict, sent: bool):
     """
-    Отправляет напоминание через WhatsApp.
+    Сообщает диспетчеру результат доставки напоминания.
 
     Параметры:
-        phone_number (str): Номер телефона получателя.
-        reminder_text (str): Текст напоминания.
+        reminder (dict): Доставленное сообщение; объединенное сообщение содержит ID напоминаний в `ids`.
+        sent (bool): Признак успешной отправки.
     """
-    try:
-        client.messages.create(
-            body=reminder_text,
-            from_=f'whatsapp:{FROM_NUMBER}',
-            to=f'whatsapp:{phone_number}'
-        )
-        logger.info("Напоминание, отправленно на %s : %s", phone_number, reminder_text)
-    except Exception as e:
-        logger.error("Напоминание не отправлено. Ошибка в функции send_reminder -\n %s", e)
-        raise HTTPException(status_code=500, detail="Ошибка при отправке напоминания") from e
+    for reminder_id in reminder.get("ids", [reminder["id"]]):
+        dispatcher.complete(reminder_id, sent)
+        # Время повторяющегося напоминания меняется после отправки
+        await cache.invalidate(reminder_id)
+    await cache.invalidate(phone_number=reminder["phone_number"])
+
+async def prepare_reminder(message: dict):
+    """
+    Убирает из сообщения напоминания, удаленные или захваченные другим процессом
+    после передачи на отправку.
+
+    Параметры:
+        message (dict): Сообщение, ожидающее отправки в конвейере доставки.
+
+    Возвращает:
+        dict | None: Сообщение для отправки или None, если не осталось ни одного напоминания.
+    """
+    # Проверка выполняет запрос к базе данных, поэтому не блокирует цикл событий конвейера
+    return await asyncio.to_thread(dispatcher.prepare, message)
+
+# Инициализация конвейера доставки
+pipeline = DeliveryPipeline(
+    TwilioSender(ACCOUNT_SID, AUTH_TOKEN, api_url=TWILIO_API_URL),
+    FROM_NUMBER,
+    on_done=on_delivered,
+    concurrency=SEND_CONCURRENCY,
+    rate=SEND_RATE,
+    burst=SEND_BURST,
+    max_retries=SEND_MAX_RETRIES,
+    prepare=prepare_reminder
+)
+
+def deliver_reminder(reminder: dict):
+    """
+    Передает наступившее напоминание в конвейер доставки WhatsApp.
+
+    Параметры:
+        reminder (dict): Напоминание, полученное от диспетчера.
+    """
+    pipeline.submit(reminder)
+
+# Инициализация диспетчеров отправки (по одному на шард)
+dispatcher = ShardedDispatcher(
+    store,
+    deliver=deliver_reminder,
+    coalesce_window=COALESCE_WINDOW,
+    max_message_length=MAX_MESSAGE_LENGTH,
+    message_cache_size=MESSAGE_CACHE_SIZE,
+    worker_id=WORKER_ID,
+    lease=DISPATCH_LEASE,
+    claim_batch=DISPATCH_CLAIM_BATCH,
+    max_inflight=DISPATCH_MAX_INFLIGHT
+)
+
+# Инициализация задач хранения (по одной на шард)
+retention_workers = [
+    RetentionWorker(
+        path,
+        retention=RETENTION_DAYS * 86400,
+        interval=RETENTION_INTERVAL,
+        batch_size=RETENTION_BATCH_SIZE,
+        archive=RETENTION_ARCHIVE
+    )
+    for path in store.paths
+]
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Запускает писатель, конвейер доставки, диспетчер и задачу хранения при старте приложения и останавливает их при завершении.
+    """
+    writer.start()
+    pipeline.start()
+    dispatcher.start()
+    for retention in retention_workers:
+        retention.start()
+    yield
+    for retention in retention_workers:
+        retention.stop()
+    writer.stop()
+    dispatcher.stop()
+    pipeline.stop()
+    dispatcher.flush()
+
+# Метрики состояния компонентов, вычисляемые при сборе
+GaugeCallback("reminders_dispatcher_queue_depth", "Количество неотправленных напоминаний в окне диспетчера",
+              dispatcher.due_count)
+GaugeCallback("reminders_dispatcher_due_times", "Количество различных значений времени в окне диспетчера",
+              lambda: dispatcher.stats()["due_times"])
+GaugeCallback("reminders_dispatcher_inflight", "Количество напоминаний, переданных на отправку",
+              lambda: dispatcher.stats()["inflight"])
+GaugeCallback("reminders_dispatcher_next_due_timestamp_seconds", "Время ближайшего напоминания в окне диспетчера",
+              lambda: dispatcher.stats()["next_due_at"])
+GaugeCallback("reminders_group_commit", "Настройки и длина очереди групповой фиксации", writer.stats, ["stat"])
+GaugeCallback("reminders_cache", "Счетчики кэша чтения", cache.stats, ["stat"])
+GaugeCallback("reminders_message_cache", "Счетчики кэша отрисованных текстов напоминаний",
+              dispatcher.message_cache_stats, ["stat"])
+
+# Инициализация FastAPI
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 @app.post("/reminder/")
 async def create_reminder(reminder: Reminder):
@@ -79,48 +218,191 @@ async def create_reminder(reminder: Reminder):
     Создает и сохраняет напоминание в базе данных.
 
     Параметры:
-        reminder (Reminder): Объект напоминания, содержащий номер телефона, текст и время.
+        reminder (Reminder): Объект напоминания, содержащий номер телефона, текст, время
+            и необязательное правило повторения.
 
     Возвращает:
         dict: Сообщение об успешном создании напоминания.
     """
     try:
         # Проверка корректности формата времени
-        reminder_time = datetime.datetime.strptime(reminder.reminder_time, "%Y-%m-%d %H:%M:%S")
+        reminder_time = datetime.datetime.strptime(reminder.reminder_time, TIME_FORMAT)
     except ValueError as e:
         logger.error("Некорректный формат времени: %s", e)
         raise HTTPException(status_code=400, detail="Некорректный формат времени. Используйте формат 'YYYY-MM-DD HH:MM:SS'.") from e
 
     try:
-        save_reminder(CONN, C, reminder)
-        scheduler.add_job(
-            send_reminder,
-            'date',
-            run_date=reminder_time,
-            args=[reminder.phone_number, reminder.reminder_text]
-        )
+        # Время хранится в едином формате; для cron-правила это его первое срабатывание
+        due_at = first_fire_time(int(reminder_time.timestamp()), reminder.repeat_cron)
+        reminder.reminder_time = format_timestamp(due_at)
+        data = {**reminder.model_dump(), "due_at": due_at}
+        reminder_id = await writer.submit(data)
+        await cache.invalidate(phone_number=reminder.phone_number)
+        dispatcher.notify({"id": reminder_id, **data})
         return {"message": "Напоминание установлено успешно"}
     except Exception as e:
         logger.error("Ошибка в функции create_reminder - \n %s", e)
         raise HTTPException(status_code=500, detail="Ошибка при создании напоминания") from e
 
+# Максимальное количество ошибок, возвращаемых в ответе массовой загрузки
+MAX_REPORTED_ERRORS = 1000
+
+@app.post("/reminders/bulk")
+async def import_reminders(request: Request):
+    """
+    Массово создает напоминания из потока NDJSON или CSV.
+
+    Тело запроса разбирается по мере поступления, корректные строки сохраняются пачками
+    по `BULK_CHUNK_SIZE` в одной транзакции и сразу передаются диспетчеру. Ошибочные
+    строки пропускаются и перечисляются в ответе.
+
+    Параметры:
+        request (Request): Запрос с телом в формате NDJSON (`application/x-ndjson`) или CSV (`text/csv`).
+
+    Возвращает:
+        dict: Количество созданных и отклоненных напоминаний и ошибки по строкам.
+    """
+    created = 0
+    failed = 0
+    errors = []
+    chunk = []
+
+    async def flush():
+        nonlocal created
+        ids = await store.save_reminders(chunk)
+        dispatcher.notify_many([{"id": reminder_id, **reminder} for reminder_id, reminder in zip(ids, chunk)])
+        for phone_number in {reminder["phone_number"] for reminder in chunk}:
+            await cache.invalidate(phone_number=phone_number)
+        created += len(ids)
+        chunk.clear()
+
+    try:
+        content_type = request.headers.get("content-type", "application/x-ndjson")
+        async for line, reminder, error in iter_records(request.stream(), content_type):
+            if error is not None:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line, "error": error})
+                continue
+            chunk.append(reminder)
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+    except Exception as e:
+        logger.error("Ошибка в функции import_reminders - \n %s", e)
+        raise HTTPException(status_code=500, detail={
+            "message": "Ошибка при массовом создании напоминаний",
+            "created": created
+        }) from e
+    return {"created": created, "failed": failed, "errors": errors, "errors_truncated": failed > len(errors)}
+
+# Размер страницы списка напоминаний по умолчанию и максимальный
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Коды статусов доставки по их названиям в API
+STATUS_CODES = {name: code for code, name in STATUS_NAMES.items()}
+
+def encode_cursor(reminder: dict) -> str:
+    """
+    Кодирует позицию напоминания в курсор страницы.
+
+    Параметры:
+        reminder (dict): Последнее напоминание страницы.
+
+    Возвращает:
+        str: Курсор вида `<due_at>_<id>`.
+    """
+    return f"{reminder['due_at']}_{reminder['id']}"
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Разбирает курсор страницы.
+
+    Параметры:
+        cursor (str): Курсор вида `<due_at>_<id>`.
+
+    Возвращает:
+        tuple: Ключ `(due_at, id)`.
+    """
+    try:
+        due_at, reminder_id = cursor.split("_")
+        return int(due_at), int(reminder_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы") from e
+
+def parse_time_filter(value: Optional[str]) -> Optional[int]:
+    """
+    Переводит границу фильтра по времени в секунды эпохи.
+
+    Параметры:
+        value (str | None): Время в формате `YYYY-MM-DD HH:MM:SS`.
+
+    Возвращает:
+        int | None: Время в секундах эпохи.
+    """
+    if value is None:
+        return None
+    try:
+        return int(datetime.datetime.strptime(value, TIME_FORMAT).timestamp())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Некорректный формат времени. Используйте формат 'YYYY-MM-DD HH:MM:SS'.") from e
+
 @app.get("/reminders/")
-async def get_reminders(phone_number: str):
+async def get_reminders(
+    phone_number: str,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    time_from: Optional[str] = None,
+    time_to: Optional[str] = None,
+    status: Optional[Literal["pending", "sent", "failed"]] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
     """
-    Возвращает все напоминания для указанного номера телефона.
+    Возвращает напоминания для указанного номера телефона в порядке времени.
+
+    В формате `json` возвращается одна страница не более `limit` напоминаний и курсор
+    `next_cursor` для запроса следующей страницы. В формате `ndjson` напоминания
+    передаются потоком по одному на строку, начиная с позиции `cursor`.
 
     Параметры:
         phone_number (str): Номер телефона.
+        limit (int | None): Размер страницы (для `ndjson` - общее ограничение количества).
+        cursor (str | None): Курсор из `next_cursor` предыдущей страницы.
+        time_from (str | None): Нижняя граница времени напоминания включительно.
+        time_to (str | None): Верхняя граница времени напоминания включительно.
+        status (str | None): Статус доставки: `pending`, `sent` или `failed`.
+        format (str): Формат ответа: `json` или `ndjson`.
 
     Возвращает:
-        dict: Список напоминаний.
+        dict: Страница напоминаний и курсор следующей страницы.
     """
+    filters = {
+        "after": decode_cursor(cursor) if cursor else None,
+        "due_from": parse_time_filter(time_from),
+        "due_to": parse_time_filter(time_to),
+        "status": STATUS_CODES[status] if status else None
+    }
+    if format == "ndjson":
+        reminders = store.iter_reminders(phone_number, limit=limit, **filters)
+        lines = (json.dumps(reminder, ensure_ascii=False) + "\n" for reminder in reminders)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    params = {"limit": limit, **filters}
+    page, version = await cache.get_listing(phone_number, params)
+    if page is not None:
+        return page
     try:
-        reminders = get_reminders_by_phone_number(C, phone_number)
-        return {"reminders": reminders}
+        reminders = await store.list_reminders(phone_number, limit, **filters)
     except Exception as e:
         logger.error("Ошибка в функции get_reminders - \n %s", e)
         raise HTTPException(status_code=500, detail="Ошибка при получении напоминаний") from e
+    next_cursor = encode_cursor(reminders[-1]) if len(reminders) == limit else None
+    page = {"reminders": reminders, "next_cursor": next_cursor}
+    await cache.set_listing(phone_number, params, page, version)
+    return page
 
 @app.get("/reminder/{reminder_id}")
 async def get_reminder(reminder_id: int, phone_number: str):
@@ -134,14 +416,18 @@ async def get_reminder(reminder_id: int, phone_number: str):
     Возвращает:
         dict: Напоминание, если найдено и принадлежит указанному номеру, иначе сообщение об ошибке.
     """
-    try:
-        result = get_reminder_by_id_for_phone(C, reminder_id, phone_number)
-        if not result:
-            raise HTTPException(status_code=404, detail="Напоминание не найдено")
-        return result
-    except Exception as e:
-        logger.error("Ошибка в функции get_reminder - \n %s", e)
-        raise HTTPException(status_code=500, detail="Ошибка при получении напоминания") from e
+    reminder, version = await cache.get_reminder(reminder_id)
+    if reminder is None:
+        try:
+            reminder = await store.get_reminder(reminder_id)
+        except Exception as e:
+            logger.error("Ошибка в функции get_reminder - \n %s", e)
+            raise HTTPException(status_code=500, detail="Ошибка при получении напоминания") from e
+        if reminder is not None:
+            await cache.set_reminder(reminder, version)
+    if reminder is None or reminder["phone_number"] != phone_number:
+        return {"message": "Напоминание не найдено или не принадлежит указанному номеру телефона"}
+    return {"reminder": reminder}
 
 @app.delete("/reminder/{reminder_id}")
 async def delete_reminder(reminder_id: int):
@@ -155,15 +441,60 @@ async def delete_reminder(reminder_id: int):
         dict: Сообщение об успешном удалении напоминания.
     """
     try:
-        reminder = get_reminder_by_id_for_phone(C, reminder_id, "*")
-        if not reminder:
-            raise HTTPException(status_code=404, detail="Напоминание не найдено")
-
-        delete_reminder_by_id(CONN, C, reminder_id)
-        return {"message": "Напоминание успешно удалено"}
+        phone_number = await store.delete_reminder_by_id(reminder_id)
     except Exception as e:
         logger.error("Ошибка в функции delete_reminder - \n %s", e)
         raise HTTPException(status_code=500, detail="Ошибка при удалении напоминания") from e
+    if phone_number is None:
+        raise HTTPException(status_code=404, detail="Напоминание не найдено")
+    dispatcher.cancel([reminder_id])
+    await cache.invalidate(reminder_id=reminder_id, phone_number=phone_number)
+    return {"message": "Напоминание успешно удалено"}
+
+@app.delete("/reminders/")
+async def delete_reminders(
+    phone_number: Optional[str] = None,
+    time_from: Optional[str] = None,
+    time_to: Optional[str] = None
+):
+    """
+    Удаляет напоминания по номеру телефона и/или диапазону времени и снимает их с отправки.
+
+    Параметры:
+        phone_number (str | None): Номер телефона.
+        time_from (str | None): Нижняя граница времени напоминания включительно.
+        time_to (str | None): Верхняя граница времени напоминания включительно.
+
+    Возвращает:
+        dict: Количество удаленных напоминаний.
+    """
+    if phone_number is None and time_from is None and time_to is None:
+        raise HTTPException(status_code=400, detail="Укажите номер телефона или диапазон времени")
+    due_from = parse_time_filter(time_from)
+    due_to = parse_time_filter(time_to)
+    try:
+        deleted = await store.delete_reminders(phone_number, due_from, due_to)
+    except Exception as e:
+        logger.error("Ошибка в функции delete_reminders - \n %s", e)
+        raise HTTPException(status_code=500, detail="Ошибка при удалении напоминаний") from e
+    dispatcher.cancel([reminder_id for reminder_id, _ in deleted])
+    for reminder_id, _ in deleted:
+        await cache.invalidate(reminder_id=reminder_id)
+    for deleted_phone in {phone for _, phone in deleted}:
+        await cache.invalidate(phone_number=deleted_phone)
+    return {"message": "Напоминания успешно удалены", "deleted": len(deleted)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Возвращает метрики приложения в текстовом формате Prometheus.
+
+    Возвращает:
+        str: Метрики задержки запросов, запросов к базе данных, очереди диспетчера,
+        задержки доставки, обращений к Twilio, групповой фиксации и кэша.
+    """
+    # Часть метрик читается из базы данных, поэтому сбор выполняется вне цикла событий
+    return PlainTextResponse(await asyncio.to_thread(render_metrics), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
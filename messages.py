@@ -0,0 +1,133 @@
+"""
+Модуль `messages.py` отрисовывает тексты напоминаний перед отправкой.
+
+Основные функции:
+- `render_message(body, params)`: Подставляет параметры получателя в шаблон текста.
+- `check_template(body, params)`: Проверяет, что шаблон отрисовывается с указанными параметрами.
+
+Основные классы:
+- `MessageRenderer`: Отрисовка текстов захваченных напоминаний с LRU-кэшем.
+
+Описание:
+    Текст напоминания хранится один раз в таблице `messages` (см. модуль `database.py`),
+    а напоминание ссылается на него по `message_id` и может содержать параметры шаблона
+    `params`. Шаблоны используют синтаксис `string.Template`: `$name` или `${name}`,
+    знак `$` записывается как `$$`. Текст без параметров отправляется как есть.
+
+    Диспетчер передает на отправку напоминания без текста, а `MessageRenderer` заполняет
+    `reminder_text` непосредственно перед отправкой. Отрисованные тексты хранятся в кэше
+    `LRUCache` по ключу `(message_id, params)`; тексты в таблице `messages` не изменяются,
+    поэтому записи кэша не устаревают. Исходный текст хранится в том же кэше с ключом
+    `(message_id, None)`, поэтому при рассылке шаблона на много номеров текст читается
+    из базы один раз.
+
+Пример использования:
+    >>> text = render_message("Здравствуйте, $name!", {"name": "Анна"})
+    >>> renderer = MessageRenderer(max_entries=1024)
+    >>> renderer.render(conn, reminders)
+"""
+
+import json
+import math
+from string import Template
+
+from cache import LRUCache
+from database import get_message_bodies
+
+def render_message(body, params=None):
+    """
+    Подставляет параметры получателя в шаблон текста.
+
+    Параметры:
+        body (str): Текст или шаблон напоминания.
+        params (dict | None): Параметры шаблона.
+
+    Возвращает:
+        str: Отрисованный текст; без параметров текст возвращается без изменений.
+    """
+    if not params:
+        return body
+    # Отсутствующие параметры остаются в тексте как есть, чтобы отправка не прерывалась
+    return Template(body).safe_substitute(params)
+
+def check_template(body, params):
+    """
+    Проверяет, что шаблон отрисовывается с указанными параметрами.
+
+    Параметры:
+        body (str): Шаблон напоминания.
+        params (dict): Параметры шаблона.
+
+    Исключения:
+        ValueError: Если в шаблоне есть некорректный заполнитель или для него нет параметра.
+    """
+    try:
+        Template(body).substitute(params)
+    except KeyError as e:
+        raise ValueError(f"Не указан параметр шаблона: {e.args[0]}") from e
+    except ValueError as e:
+        raise ValueError(f"Некорректный шаблон текста: {e}") from e
+
+
+class MessageRenderer:
+    """
+    Отрисовка текстов напоминаний с кэшем отрисованных текстов.
+
+    Атрибуты:
+        max_entries (int): Максимальное количество текстов в кэше.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._cache = LRUCache(max_entries, ttl=math.inf)
+
+    def render(self, conn, reminders):
+        """
+        Заполняет `reminder_text` напоминаний, полученных от `claim_due_reminders`.
+
+        Поля `message_id` и `params` удаляются из напоминаний. Исходные тексты, которых
+        нет в кэше, читаются из базы одним запросом на всю порцию.
+
+        Параметры:
+            conn: Объект соединения с базой данных.
+            reminders (list): Напоминания с полями `message_id` и `params` (JSON-строка или None).
+
+        Возвращает:
+            list: Напоминания, текст которых не найден в базе (их нельзя отправить).
+        """
+        missing = {}
+        for reminder in reminders:
+            key = (reminder.pop("message_id"), reminder.pop("params"))
+            text = self._cache.get(key)
+            if text is None:
+                missing.setdefault(key, []).append(reminder)
+            else:
+                reminder["reminder_text"] = text
+        if not missing:
+            return []
+
+        bodies = {message_id: self._cache.get((message_id, None)) for message_id, _ in missing}
+        unknown = [message_id for message_id, body in bodies.items() if body is None and message_id is not None]
+        if unknown:
+            for message_id, body in get_message_bodies(conn, unknown).items():
+                bodies[message_id] = body
+                self._cache.set((message_id, None), body)
+
+        failed = []
+        for (message_id, params), group in missing.items():
+            body = bodies.get(message_id)
+            if body is None:
+                failed.extend(group)
+                continue
+            text = render_message(body, json.loads(params) if params else None)
+            if params:
+                self._cache.set((message_id, params), text)
+            for reminder in group:
+                reminder["reminder_text"] = text
+        return failed
+
+    def stats(self):
+        """
+        Возвращает счетчики попаданий, промахов и вытеснений кэша.
+        """
+        return self._cache.stats()
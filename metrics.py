@@ -0,0 +1,311 @@
+"""
+Модуль `metrics.py` реализует метрики приложения в формате Prometheus.
+
+Основные классы:
+- `Counter`: Монотонный счетчик.
+- `Gauge`: Значение, которое может увеличиваться и уменьшаться.
+- `GaugeCallback`: Значение, вычисляемое функцией в момент сбора метрик.
+- `Histogram`: Гистограмма распределения значений (задержек).
+- `MetricsMiddleware`: ASGI-middleware с гистограммой задержки запросов по маршрутам.
+
+Основные функции:
+- `render()`: Возвращает все зарегистрированные метрики в текстовом формате Prometheus.
+- `timed(histogram)`: Декоратор, измеряющий длительность вызова функции.
+
+Описание:
+    Метрики рассчитаны на постоянную работу в продакшене, поэтому запись на горячем пути
+    не использует блокировок: каждый поток увеличивает значения в своем собственном
+    сегменте (списке), а при сборе метрик сегменты всех потоков суммируются. Блокировка
+    берется только при первом обращении нового потока к метрике или при создании нового
+    набора меток.
+
+Пример использования:
+    >>> REQUESTS = Counter("app_requests_total", "Количество запросов", ["route"])
+    >>> REQUESTS.labels("/reminder/").inc()
+    >>> LATENCY = Histogram("app_latency_seconds", "Задержка запросов")
+    >>> LATENCY.observe(0.012)
+    >>> print(render())
+"""
+
+import bisect
+import functools
+import threading
+import time
+
+# Границы корзин гистограмм по умолчанию в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Зарегистрированные метрики в порядке создания
+REGISTRY = []
+_registry_lock = threading.Lock()
+
+
+class _ThreadShards:
+    """
+    Набор сегментов значений, по одному на поток; поток пишет только в свой сегмент.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = [0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def total(self):
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(values) for values in zip(*shards)] if shards else [0] * self._size
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    """
+    Базовый класс метрики с поддержкой меток.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Возвращает метрику для указанных значений меток.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _collect(self):
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Возвращает метрику в текстовом формате Prometheus.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._collect())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _ThreadShards(1)
+
+    def inc(self, amount=1):
+        self._shards.get()[0] += amount
+
+    def dec(self, amount=1):
+        self._shards.get()[0] -= amount
+
+    def value(self):
+        return self._shards.total()[0]
+
+
+class Counter(_Metric):
+    """
+    Монотонный счетчик.
+    """
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        """
+        Увеличивает счетчик без меток.
+        """
+        self._default().inc(amount)
+
+    def _collect(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {child.value()}"
+
+
+class Gauge(Counter):
+    """
+    Значение, которое может увеличиваться и уменьшаться (например, количество запросов в работе).
+    """
+
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        """
+        Уменьшает значение без меток.
+        """
+        self._default().dec(amount)
+
+
+class GaugeCallback(_Metric):
+    """
+    Значение, вычисляемое функцией в момент сбора метрик.
+
+    Функция возвращает число, None (значение пропускается) или словарь
+    `{значение метки: число}` для метрики с одной меткой.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, func, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def _collect(self):
+        try:
+            value = self.func()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for label, item in value.items():
+                if item is not None:
+                    yield f"{self.name}{_format_labels(self.labelnames, (label,))} {item}"
+        elif value is not None:
+            yield f"{self.name} {value}"
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # Корзины, корзина +Inf и сумма наблюдений
+        self._shards = _ThreadShards(len(buckets) + 2)
+
+    def observe(self, value):
+        shard = self._shards.get()
+        shard[bisect.bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        return self._shards.total()
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма распределения значений.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """
+        Добавляет наблюдение в гистограмму без меток.
+        """
+        self._default().observe(value)
+
+    def _collect(self):
+        for values, child in list(self._children.items()):
+            snapshot = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), snapshot[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {snapshot[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {cumulative}"
+
+
+def timed(histogram):
+    """
+    Декоратор, записывающий длительность вызова функции в гистограмму с меткой имени функции.
+
+    Параметры:
+        histogram (Histogram): Гистограмма с одной меткой (имя функции).
+    """
+    def decorator(func):
+        child = histogram.labels(func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def render():
+    """
+    Возвращает все зарегистрированные метрики в текстовом формате Prometheus.
+    """
+    with _registry_lock:
+        metrics = list(REGISTRY)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Метрики HTTP-запросов
+HTTP_REQUEST_DURATION = Histogram(
+    "reminders_http_request_duration_seconds", "Задержка HTTP-запросов по маршрутам", ["method", "route"])
+HTTP_RESPONSES = Counter(
+    "reminders_http_responses_total", "Количество HTTP-ответов по маршрутам и статусам", ["method", "route", "status"])
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware, записывающее задержку и статус каждого HTTP-запроса по шаблону маршрута.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_DURATION.labels(scope["method"], path).observe(time.perf_counter() - started)
+            HTTP_RESPONSES.labels(scope["method"], path, str(status)).inc()
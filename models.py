@@ -8,12 +8,32 @@
     Этот модуль использует библиотеку Pydantic для создания моделей данных с валидацией.
     Модель `Reminder` используется для передачи данных о напоминании между компонентами приложения.
 
+    Повторяющееся напоминание задается одним из правил: cron-выражением `repeat_cron`
+    или интервалом `repeat_every` в секундах, а также необязательной датой окончания
+    `repeat_until`. Время `reminder_time` в этом случае означает начало повторений.
+
+    Текст `reminder_text` может быть шаблоном `string.Template` с параметрами получателя
+    `params` (например, `Здравствуйте, $name!` и `{"name": "Анна"}`): рассылка одного
+    шаблона на много номеров хранит текст один раз, а для каждого номера - только параметры.
+
 Пример использования:
     >>> from models import Reminder
     >>> reminder = Reminder(phone_number="+79123456789", reminder_text="Позвонить маме", reminder_time="2023-10-01 12:00:00")
+    >>> daily = Reminder(phone_number="+79123456789", reminder_text="Принять таблетку",
+    ...                  reminder_time="2023-10-01 09:00:00", repeat_cron="0 9 * * *", repeat_until="2024-10-01 00:00:00")
+    >>> templated = Reminder(phone_number="+79123456789", reminder_text="Здравствуйте, $name!",
+    ...                      reminder_time="2023-10-01 12:00:00", params={"name": "Анна"})
 """
 
-from pydantic import BaseModel
+import datetime
+import json
+from typing import Dict, Optional
+
+from pydantic import BaseModel, field_validator, model_validator
+
+from database import TIME_FORMAT
+from messages import check_template
+from recurrence import first_fire_time, parse_cron
 
 class Reminder(BaseModel):
     """
@@ -21,9 +41,92 @@ class Reminder(BaseModel):
 
     Атрибуты:
         phone_number (str): Номер телефона, на который отправляется напоминание.
-        reminder_text (str): Текст напоминания.
+        reminder_text (str): Текст или шаблон напоминания.
         reminder_time (str): Время напоминания в формате строки (YYYY-MM-DD HH:MM:SS).
+        repeat_cron (str | None): Cron-выражение повторения (минута, час, день, месяц, день недели).
+        repeat_every (int | None): Интервал повторения в секундах.
+        repeat_until (str | None): Время окончания повторений в формате строки (YYYY-MM-DD HH:MM:SS).
+        params (dict | None): Параметры шаблона текста для получателя.
     """
     phone_number: str
     reminder_text: str
     reminder_time: str
+    repeat_cron: Optional[str] = None
+    repeat_every: Optional[int] = None
+    repeat_until: Optional[str] = None
+    params: Optional[Dict[str, str]] = None
+
+    @field_validator("repeat_cron", "repeat_every", "repeat_until", mode="before")
+    @classmethod
+    def empty_to_none(cls, value):
+        # Пустые колонки CSV означают отсутствие правила
+        return None if value == "" else value
+
+    @field_validator("params", mode="before")
+    @classmethod
+    def parse_params(cls, value):
+        # В CSV параметры передаются JSON-объектом в колонке `params`
+        if value == "" or value is None:
+            return None
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError as e:
+                raise ValueError("Параметры шаблона должны быть JSON-объектом") from e
+        if not isinstance(value, dict):
+            raise ValueError("Параметры шаблона должны быть JSON-объектом")
+        return {str(key): str(item) for key, item in value.items()} or None
+
+    @field_validator("repeat_cron")
+    @classmethod
+    def check_cron(cls, value):
+        if value is not None:
+            parse_cron(value)
+        return value
+
+    @field_validator("repeat_every")
+    @classmethod
+    def check_every(cls, value):
+        if value is not None and value <= 0:
+            raise ValueError("Интервал повторения должен быть положительным числом секунд")
+        return value
+
+    @field_validator("repeat_until")
+    @classmethod
+    def check_until(cls, value):
+        if value is not None:
+            try:
+                value = datetime.datetime.strptime(value, TIME_FORMAT).strftime(TIME_FORMAT)
+            except ValueError as e:
+                raise ValueError("Некорректный формат времени. Используйте формат 'YYYY-MM-DD HH:MM:SS'.") from e
+        return value
+
+    @model_validator(mode="after")
+    def check_params(self):
+        if self.params is not None:
+            check_template(self.reminder_text, self.params)
+        return self
+
+    @model_validator(mode="after")
+    def check_rule(self):
+        if self.repeat_cron is not None and self.repeat_every is not None:
+            raise ValueError("Укажите только одно правило повторения: repeat_cron или repeat_every")
+        if self.repeat_until is not None and self.repeat_cron is None and self.repeat_every is None:
+            raise ValueError("repeat_until задается только вместе с правилом повторения")
+        if self.repeat_cron is None and self.repeat_every is None:
+            return self
+        try:
+            start = datetime.datetime.strptime(self.reminder_time, TIME_FORMAT)
+        except ValueError:
+            # Формат времени напоминания проверяется при его сохранении
+            return self
+        if self.repeat_until is not None:
+            until = datetime.datetime.strptime(self.repeat_until, TIME_FORMAT)
+            if until < start:
+                raise ValueError("repeat_until не может быть раньше reminder_time")
+        first = first_fire_time(int(start.timestamp()), self.repeat_cron)
+        if first is None:
+            raise ValueError("Cron-выражение не совпадает ни с одной датой")
+        if self.repeat_until is not None and first > until.timestamp():
+            raise ValueError("Первое срабатывание правила повторения позже repeat_until")
+        return self
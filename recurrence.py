@@ -0,0 +1,135 @@
+"""
+Модуль `recurrence.py` вычисляет время срабатывания повторяющихся напоминаний.
+
+Основные функции:
+- `parse_cron(expression)`: Разбирает cron-выражение из пяти полей.
+- `first_fire_time(start, repeat_cron)`: Возвращает время первого срабатывания правила.
+- `next_fire_time(due_at, repeat_cron, repeat_every, now)`: Возвращает время следующего срабатывания после отправки.
+
+Описание:
+    Повторяющееся напоминание хранится одной строкой таблицы `reminders` с правилом
+    повторения: cron-выражением (`repeat_cron`, например `0 9 * * 1-5`) или интервалом
+    в секундах (`repeat_every`) и необязательной датой окончания (`repeat_until`).
+    Поле `due_at` содержит время ближайшего срабатывания; после каждой отправки оно
+    переносится на следующее срабатывание правила.
+
+    Cron-выражения вычисляются триггером `CronTrigger` библиотеки APScheduler в локальном
+    часовом поясе, как и время напоминаний. Срабатывания, пропущенные за время простоя
+    приложения, не отправляются повторно: следующее время всегда позже текущего.
+
+Пример использования:
+    >>> due_at = first_fire_time(1696150800, "0 9 * * 1-5")
+    >>> next_fire_time(due_at, "0 9 * * 1-5", None, now=due_at)
+"""
+
+import datetime
+import functools
+
+from apscheduler.triggers.cron import CronTrigger
+
+# Дни недели в нумерации cron (0 и 7 - воскресенье)
+DAY_NAMES = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+def _day_number(value):
+    value = value.strip().lower()
+    if value in DAY_NAMES:
+        return DAY_NAMES.index(value)
+    number = int(value)
+    if not 0 <= number <= 7:
+        raise ValueError(f"Некорректный день недели: {value}")
+    return number % 7
+
+def _day_of_week(field):
+    """
+    Переводит поле дня недели из нумерации cron в список названий дней.
+
+    APScheduler нумерует дни с понедельника (0 - понедельник), а cron - с воскресенья,
+    поэтому поле передается триггеру явным списком названий.
+    """
+    days = set()
+    for part in field.split(","):
+        base, _, step = part.partition("/")
+        if base == "*":
+            first, last = 0, 6
+        elif "-" in base:
+            first, last = (_day_number(value) for value in base.split("-", 1))
+            # Диапазон, заканчивающийся воскресеньем (`5-0`), продолжается до конца недели
+            if last == 0 and first:
+                last = 7
+        else:
+            first = last = _day_number(base)
+            if step:
+                last = 6
+        days.update(day % 7 for day in range(first, last + 1, int(step) if step else 1))
+    if not days:
+        raise ValueError(f"Некорректное поле дня недели: {field}")
+    return ",".join(DAY_NAMES[day] for day in sorted(days))
+
+@functools.lru_cache(maxsize=1024)
+def parse_cron(expression):
+    """
+    Разбирает cron-выражение из пяти полей (минута, час, день, месяц, день недели).
+
+    Параметры:
+        expression (str): Cron-выражение.
+
+    Возвращает:
+        CronTrigger: Триггер APScheduler в локальном часовом поясе.
+
+    Исключения:
+        ValueError: Если выражение некорректно.
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron-выражение должно содержать 5 полей, получено {len(fields)}")
+    minute, hour, day, month, day_of_week = fields
+    return CronTrigger(minute=minute, hour=hour, day=day, month=month,
+                       day_of_week=day_of_week if day_of_week == "*" else _day_of_week(day_of_week))
+
+def _cron_after(expression, after):
+    """
+    Возвращает первое срабатывание cron-выражения строго позже `after` (секунды эпохи).
+    """
+    trigger = parse_cron(expression)
+    fire_time = trigger.get_next_fire_time(None, datetime.datetime.fromtimestamp(after + 1, trigger.timezone))
+    return int(fire_time.timestamp()) if fire_time else None
+
+def first_fire_time(start, repeat_cron=None):
+    """
+    Возвращает время первого срабатывания напоминания.
+
+    Для cron-правила это первое совпадение не раньше `start` (None, если выражение
+    не совпадает ни с одной датой, например `0 0 30 2 *`), для остальных напоминаний -
+    само `start`.
+
+    Параметры:
+        start (int): Время напоминания из запроса (секунды эпохи).
+        repeat_cron (str | None): Cron-выражение правила повторения.
+
+    Возвращает:
+        int | None: Время первого срабатывания в секундах эпохи.
+    """
+    if repeat_cron:
+        return _cron_after(repeat_cron, start - 1)
+    return start
+
+def next_fire_time(due_at, repeat_cron=None, repeat_every=None, now=None):
+    """
+    Возвращает время следующего срабатывания правила после срабатывания `due_at`.
+
+    Параметры:
+        due_at (int): Время отправленного срабатывания (секунды эпохи).
+        repeat_cron (str | None): Cron-выражение правила повторения.
+        repeat_every (int | None): Интервал повторения в секундах.
+        now (float | None): Текущее время; пропущенные срабатывания до него не возвращаются.
+
+    Возвращает:
+        int | None: Время следующего срабатывания или None, если напоминание не повторяется.
+    """
+    after = max(due_at, int(now)) if now is not None else due_at
+    if repeat_cron:
+        return _cron_after(repeat_cron, after)
+    if repeat_every:
+        # Срабатывания остаются кратны интервалу от первого времени напоминания
+        return due_at + ((after - due_at) // repeat_every + 1) * repeat_every
+    return None
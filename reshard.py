@@ -0,0 +1,193 @@
+"""
+Модуль `reshard.py` содержит утилиту перераспределения напоминаний по шардам.
+
+Основные функции:
+- `reshard(source, source_shards, target, shards, batch_size, mapping)`: Копирует напоминания в новые шарды.
+
+Описание:
+    Утилита читает напоминания из существующей базы (`reminders.db` или набора шардов
+    `--source-shards`) порциями по ID и записывает каждое в шард, определяемый хешем его
+    номера телефона при новом количестве шардов `--shards`. Исходные файлы не изменяются,
+    а целевые файлы не должны существовать, поэтому при ошибке перенос можно повторить.
+
+    Тексты напоминаний сохраняются в таблицу `messages` каждого шарда-приемника без
+    повторов. Напоминания получают новые глобальные ID; соответствие старых и новых ID
+    сохраняется в CSV-файл `--mapping`. Архив обработанных напоминаний переносится
+    в архивные таблицы целевых шардов, а счетчик ID каждого шарда сдвигается за ID архива,
+    чтобы новые напоминания не пересекались с архивными. Захваты процессов отправки
+    не переносятся.
+
+    Утилиту следует запускать при остановленном приложении, после переноса приложение
+    запускается с `SHARD_COUNT`, равным `--shards`.
+
+Пример использования:
+    >>> python reshard.py --source reminders.db --shards 4 --mapping ids.csv
+    >>> python reshard.py --source reminders.db --source-shards 4 --shards 8
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+from database import connect, create_database, save_messages, transaction
+from sharding import ShardedStore
+
+# Переносимые колонки напоминания (кроме ID и захвата процессом отправки)
+COLUMNS = ("phone_number", "message_id", "params", "reminder_time", "status", "due_at",
+           "repeat_cron", "repeat_every", "repeat_until")
+
+
+def _insert_batch(conn, table, columns, rows):
+    """
+    Вставляет строки одной транзакцией и возвращает их новые ID по порядку.
+
+    Вторая колонка строк содержит текст напоминания: ID текстов в шардах различаются,
+    поэтому текст сохраняется в таблицу `messages` шарда-приемника заново.
+    """
+    with transaction(conn):
+        message_ids = save_messages(conn, (row[1] for row in rows))
+        rows = [(row[0], message_ids[row[1]], *row[2:]) for row in rows]
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                         f"VALUES ({', '.join('?' * len(columns))})", rows)
+        # Внутри одной транзакции ID выдаются подряд, поэтому последний ID определяет все остальные
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return range(last_id - len(rows) + 1, last_id + 1)
+
+def _iter_rows(conn, table, columns, batch_size):
+    """
+    Читает строки таблицы порциями по возрастанию ID, заменяя `message_id` текстом.
+    """
+    selected = ["(SELECT body FROM messages WHERE messages.id = message_id)" if column == "message_id" else column
+                for column in columns]
+    after = 0
+    while True:
+        rows = conn.execute(f"SELECT id, {', '.join(selected)} FROM {table} "
+                            "WHERE id > ? ORDER BY id LIMIT ?", (after, batch_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+def _copy_table(sources, targets, connections, table, columns, batch_size, on_copied=None):
+    """
+    Копирует таблицу из шардов-источников в шарды-приемники по номеру телефона.
+
+    Параметры:
+        sources (ShardedStore): Шарды-источники.
+        targets (ShardedStore): Шарды-приемники.
+        connections (list): Соединения с шардами-приемниками.
+        table (str): Имя таблицы.
+        columns (tuple): Копируемые колонки; первая - номер телефона.
+        batch_size (int): Количество строк в порции.
+        on_copied (callable | None): Получает пары (старый ID, новый ID) каждой порции.
+
+    Возвращает:
+        int: Количество скопированных строк.
+    """
+    copied = 0
+    for source_shard, source_path in enumerate(sources.paths):
+        conn = connect(source_path)
+        try:
+            for rows in _iter_rows(conn, table, columns, batch_size):
+                groups = {}
+                for row in rows:
+                    groups.setdefault(targets.shard_for_phone(row[1]), []).append(row)
+                for shard, group in groups.items():
+                    new_ids = _insert_batch(connections[shard], table, columns, [row[1:] for row in group])
+                    if on_copied is not None:
+                        on_copied([(sources.global_id(row[0], source_shard), targets.global_id(new_id, shard))
+                                   for row, new_id in zip(group, new_ids)])
+                copied += len(rows)
+        finally:
+            conn.close()
+    return copied
+
+def reshard(source, source_shards, target, shards, batch_size=5000, mapping=None):
+    """
+    Перераспределяет напоминания и архив по новому количеству шардов.
+
+    Параметры:
+        source (str): Путь к базе без шардирования, от которого строятся пути шардов-источников.
+        source_shards (int): Текущее количество шардов.
+        target (str): Путь, от которого строятся пути новых шардов.
+        shards (int): Новое количество шардов.
+        batch_size (int): Количество строк, читаемых и записываемых одной транзакцией.
+        mapping (str | None): Путь к CSV-файлу соответствия старых и новых ID.
+
+    Возвращает:
+        dict: Количество перенесенных напоминаний и архивных записей.
+
+    Исключения:
+        ValueError: Если целевые файлы уже существуют или источник не найден.
+    """
+    sources = ShardedStore(source, source_shards)
+    targets = ShardedStore(target, shards)
+    missing = [path for path in sources.paths if not os.path.exists(path)]
+    if missing:
+        raise ValueError(f"Не найдены файлы источника: {', '.join(missing)}")
+    existing = [path for path in targets.paths if os.path.exists(path)]
+    if existing:
+        raise ValueError(f"Целевые файлы уже существуют: {', '.join(existing)}")
+
+    for path in sources.paths:
+        # Источник приводится к текущей схеме, чтобы читать все колонки
+        create_database(path).close()
+
+    connections = [create_database(path) for path in targets.paths]
+    mapping_file = open(mapping, "w", newline="", encoding="utf-8") if mapping else None
+    try:
+        archived = _copy_table(sources, targets, connections, "reminders_archive",
+                               COLUMNS + ("archived_at",), batch_size)
+        # Новые ID напоминаний выдаются после ID архива шарда, чтобы перенос в архив их не перезаписал
+        for conn in connections:
+            with transaction(conn):
+                max_archived = conn.execute("SELECT COALESCE(MAX(id), 0) FROM reminders_archive").fetchone()[0]
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'reminders', 0 "
+                             "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'reminders')")
+                conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'reminders'", (max_archived,))
+
+        writer = None
+        if mapping_file is not None:
+            writer = csv.writer(mapping_file)
+            writer.writerow(("old_id", "new_id"))
+        copied = _copy_table(sources, targets, connections, "reminders", COLUMNS, batch_size,
+                             on_copied=writer.writerows if writer is not None else None)
+    finally:
+        if mapping_file is not None:
+            mapping_file.close()
+        for conn in connections:
+            conn.close()
+    return {"reminders": copied, "archived": archived}
+
+
+def parse_args(argv=None):
+    """
+    Разбирает параметры командной строки.
+    """
+    parser = argparse.ArgumentParser(description="Перераспределение напоминаний по шардам SQLite")
+    parser.add_argument("--source", default="reminders.db", help="Путь к базе данных без шардирования")
+    parser.add_argument("--source-shards", type=int, default=1, help="Текущее количество шардов")
+    parser.add_argument("--target", help="Путь для новых шардов (по умолчанию совпадает с --source)")
+    parser.add_argument("--shards", type=int, required=True, help="Новое количество шардов")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Количество строк на транзакцию")
+    parser.add_argument("--mapping", help="CSV-файл для соответствия старых и новых ID")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Точка входа: перераспределяет напоминания и выводит количество перенесенных строк.
+    """
+    options = parse_args(argv)
+    try:
+        result = reshard(options.source, options.source_shards, options.target or options.source,
+                         options.shards, options.batch_size, options.mapping)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+    print(f"Перенесено напоминаний: {result['reminders']}, архивных записей: {result['archived']}")
+
+
+if __name__ == "__main__":
+    main()
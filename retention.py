@@ -0,0 +1,117 @@
+"""
+Модуль `retention.py` отвечает за фоновую очистку основной таблицы напоминаний.
+
+Основные классы:
+- `RetentionWorker`: Фоновый поток, который переносит старые обработанные напоминания в архив.
+
+Описание:
+    Диспетчер отмечает каждое напоминание как отправленное или неудачное. Задача хранения
+    периодически переносит такие напоминания старше `retention` секунд в таблицу
+    `reminders_archive` (или просто удаляет их) небольшими порциями с паузами между ними,
+    чтобы не мешать записи новых напоминаний, а затем освобождает место в файле базы
+    через `PRAGMA incremental_vacuum`. Таблица `reminders` при этом остается небольшой,
+    и запросы по номеру телефона не просматривают всю историю.
+
+    В каждом проходе также удаляются тексты таблицы `messages`, на которые больше
+    не ссылается ни одно напоминание (после удаления напоминаний через API или без архива).
+    Тексты просматриваются по ID такими же порциями с паузами.
+
+Пример использования:
+    >>> worker = RetentionWorker("reminders.db", retention=30 * 86400)
+    >>> worker.start()
+    >>> worker.stop()
+"""
+
+import threading
+import time
+
+from database import archive_reminders, connect, delete_unused_messages, incremental_vacuum
+from logger import setup_logger
+
+logger = setup_logger("retention_log", "retention_logger")
+
+
+class RetentionWorker:
+    """
+    Фоновая задача переноса старых обработанных напоминаний в архив.
+
+    Атрибуты:
+        db_path (str): Путь к файлу базы данных.
+        retention (float): Срок хранения обработанных напоминаний в основной таблице в секундах.
+        interval (float): Пауза между проходами в секундах.
+        batch_size (int): Количество строк, переносимых одной транзакцией.
+        batch_pause (float): Пауза между порциями в секундах.
+        vacuum_pages (int): Количество страниц, освобождаемых после прохода.
+        archive (bool): Сохранять ли строки в `reminders_archive` (иначе они удаляются).
+        clock (callable): Источник текущего времени в секундах эпохи.
+    """
+
+    def __init__(self, db_path, retention, interval=3600, batch_size=500, batch_pause=0.05,
+                 vacuum_pages=1000, archive=True, clock=time.time):
+        self.db_path = db_path
+        self.retention = retention
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.archive = archive
+        self.clock = clock
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Запускает фоновый поток задачи хранения.
+        """
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="reminder-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Останавливает фоновый поток после текущей порции.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        """
+        Выполняет один проход: переносит все старые обработанные напоминания порциями
+        и освобождает место в файле базы данных.
+
+        Возвращает:
+            int: Количество перенесенных напоминаний.
+        """
+        before = int(self.clock() - self.retention)
+        conn = connect(self.db_path)
+        total = 0
+        try:
+            while not self._stopping.is_set():
+                moved = archive_reminders(conn, before, self.batch_size, self.archive)
+                total += moved
+                if moved < self.batch_size:
+                    break
+                self._stopping.wait(self.batch_pause)
+            unused = 0
+            after = 0
+            while after is not None and not self._stopping.is_set():
+                deleted, after = delete_unused_messages(conn, after, self.batch_size)
+                unused += deleted
+                if after is not None:
+                    self._stopping.wait(self.batch_pause)
+            if total or unused:
+                incremental_vacuum(conn, self.vacuum_pages)
+                logger.info("Перенесено в архив напоминаний: %s, удалено неиспользуемых текстов: %s", total, unused)
+        finally:
+            conn.close()
+        return total
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Ошибка в задаче хранения напоминаний - \n %s", e)
+            self._stopping.wait(self.interval)
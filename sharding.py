@@ -0,0 +1,354 @@
+"""
+Модуль `sharding.py` реализует хранение напоминаний в нескольких файлах SQLite (шардах).
+
+Основные функции:
+- `shard_paths(path, count)`: Возвращает пути к файлам шардов.
+- `shard_for_phone(phone_number, count)`: Возвращает номер шарда для номера телефона.
+
+Основные классы:
+- `ShardedStore`: Доступ к напоминаниям с маршрутизацией запросов по шардам.
+- `ShardedWriter`: Писатели с групповой фиксацией, по одному на шард.
+- `ShardedDispatcher`: Диспетчеры отправки, по одному на шард.
+
+Описание:
+    SQLite допускает одного писателя на файл, поэтому при `SHARD_COUNT > 1` напоминания
+    распределяются по `SHARD_COUNT` файлам по хешу (CRC32) номера телефона. Каждый шард
+    имеет собственные соединения, писателя и диспетчера, поэтому запись в разные шарды
+    идет параллельно. Запросы по номеру телефона обращаются только к его шарду, запросы
+    без номера выполняются на всех шардах параллельно.
+
+    Наступающие напоминания общим просмотром всех шардов не выбираются: диспетчер каждого
+    шарда независимо просматривает свой индекс времени и захватывает наступившие
+    напоминания, поэтому шарды отправляются параллельно и каждый в порядке времени.
+
+    ID напоминания в API глобальный: `local_id * count + shard`, поэтому по ID сразу
+    определяется шард. При `count = 1` глобальный ID совпадает с ID строки, а единственный
+    шард - файл `DATABASE_PATH`, так что хранилище без шардирования работает как прежде.
+
+    Существующую базу можно перераспределить по шардам утилитой `reshard.py`.
+
+Пример использования:
+    >>> store = ShardedStore("reminders.db", count=4)
+    >>> store.create_databases()
+    >>> writer = ShardedWriter(store)
+    >>> writer.start()
+    >>> reminder_id = await writer.submit(reminder)
+    >>> reminders = await store.list_reminders("+79123456789", limit=100)
+"""
+
+import asyncio
+import os
+import zlib
+
+from database import (
+    create_database,
+    delete_reminder_by_id,
+    delete_reminders,
+    get_reminder,
+    iter_reminders,
+    list_reminders,
+    run_db,
+    save_reminders
+)
+from dispatcher import Dispatcher, without_reminders
+from group_commit import GroupCommitWriter
+
+
+def shard_paths(path, count):
+    """
+    Возвращает пути к файлам шардов.
+
+    Параметры:
+        path (str): Путь к файлу базы данных без шардирования (например, `reminders.db`).
+        count (int): Количество шардов.
+
+    Возвращает:
+        list: `[path]` при одном шарде, иначе `reminders-0.db`, `reminders-1.db` и т.д.
+    """
+    if count == 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return [f"{root}-{shard}{ext}" for shard in range(count)]
+
+def shard_for_phone(phone_number, count):
+    """
+    Возвращает номер шарда для номера телефона (одинаковый во всех процессах).
+
+    Параметры:
+        phone_number (str): Номер телефона.
+        count (int): Количество шардов.
+
+    Возвращает:
+        int: Номер шарда.
+    """
+    return zlib.crc32(phone_number.encode("utf-8")) % count
+
+
+class ShardedStore:
+    """
+    Доступ к напоминаниям, распределенным по шардам.
+
+    Атрибуты:
+        path (str): Путь к файлу базы данных без шардирования.
+        count (int): Количество шардов.
+        paths (list): Пути к файлам шардов.
+    """
+
+    def __init__(self, path, count=1):
+        if count < 1:
+            raise ValueError("Количество шардов должно быть не меньше 1")
+        self.path = path
+        self.count = count
+        self.paths = shard_paths(path, count)
+
+    def create_databases(self):
+        """
+        Создает файлы шардов и применяет к ним миграции схемы.
+        """
+        for path in self.paths:
+            create_database(path).close()
+
+    def shard_for_phone(self, phone_number):
+        return shard_for_phone(phone_number, self.count)
+
+    def shard_for_id(self, reminder_id):
+        return reminder_id % self.count
+
+    def global_id(self, local_id, shard):
+        return local_id * self.count + shard
+
+    def local_id(self, reminder_id):
+        return reminder_id // self.count
+
+    def to_global(self, reminder, shard):
+        """
+        Возвращает копию напоминания шарда с глобальными ID (`id` и `ids`).
+        """
+        if self.count == 1:
+            return reminder
+        reminder = {**reminder, "id": self.global_id(reminder["id"], shard)}
+        if "ids" in reminder:
+            reminder["ids"] = [self.global_id(local_id, shard) for local_id in reminder["ids"]]
+        return reminder
+
+    async def save_reminders(self, reminders):
+        """
+        Сохраняет пачку напоминаний: каждую часть своего шарда одной транзакцией, шарды параллельно.
+
+        Параметры:
+            reminders (list): Напоминания с полями `phone_number`, `reminder_text`, `reminder_time`, `due_at`.
+
+        Возвращает:
+            list: Глобальные ID сохраненных напоминаний в том же порядке.
+        """
+        groups = {}
+        for index, reminder in enumerate(reminders):
+            groups.setdefault(self.shard_for_phone(reminder["phone_number"]), []).append(index)
+        shards = list(groups)
+        results = await asyncio.gather(*(
+            run_db(save_reminders, [reminders[index] for index in groups[shard]], path=self.paths[shard])
+            for shard in shards))
+        ids = [None] * len(reminders)
+        for shard, local_ids in zip(shards, results):
+            for index, local_id in zip(groups[shard], local_ids):
+                ids[index] = self.global_id(local_id, shard)
+        return ids
+
+    def _local_filters(self, filters):
+        after = filters.get("after")
+        if after is not None:
+            filters = {**filters, "after": (after[0], self.local_id(after[1]))}
+        return filters
+
+    async def list_reminders(self, phone_number, limit, **filters):
+        """
+        Возвращает страницу напоминаний номера телефона из его шарда (см. `database.list_reminders`).
+        """
+        shard = self.shard_for_phone(phone_number)
+        rows = await run_db(list_reminders, phone_number, limit, path=self.paths[shard],
+                            **self._local_filters(filters))
+        return [self.to_global(row, shard) for row in rows]
+
+    def iter_reminders(self, phone_number, limit=None, **filters):
+        """
+        Генератор напоминаний номера телефона из его шарда (см. `database.iter_reminders`).
+        """
+        shard = self.shard_for_phone(phone_number)
+        for row in iter_reminders(self.paths[shard], phone_number, limit=limit, **self._local_filters(filters)):
+            yield self.to_global(row, shard)
+
+    async def get_reminder(self, reminder_id):
+        """
+        Возвращает напоминание по глобальному ID или None.
+        """
+        shard = self.shard_for_id(reminder_id)
+        reminder = await run_db(get_reminder, self.local_id(reminder_id), path=self.paths[shard])
+        return self.to_global(reminder, shard) if reminder is not None else None
+
+    async def delete_reminder_by_id(self, reminder_id):
+        """
+        Удаляет напоминание по глобальному ID и возвращает его номер телефона или None.
+        """
+        shard = self.shard_for_id(reminder_id)
+        return await run_db(delete_reminder_by_id, self.local_id(reminder_id), path=self.paths[shard])
+
+    async def delete_reminders(self, phone_number=None, due_from=None, due_to=None):
+        """
+        Удаляет напоминания по номеру телефона (в его шарде) и/или диапазону времени (во всех шардах).
+
+        Возвращает:
+            list: Пары `(id, phone_number)` удаленных напоминаний с глобальными ID.
+        """
+        shards = [self.shard_for_phone(phone_number)] if phone_number is not None else range(self.count)
+        results = await asyncio.gather(*(
+            run_db(delete_reminders, phone_number, due_from, due_to, path=self.paths[shard]) for shard in shards))
+        return [(self.global_id(local_id, shard), phone) for shard, rows in zip(shards, results)
+                for local_id, phone in rows]
+
+
+class ShardedWriter:
+    """
+    Писатели с групповой фиксацией по одному на шард.
+
+    Атрибуты:
+        store (ShardedStore): Хранилище шардов.
+        writers (list): Писатели `GroupCommitWriter` шардов.
+    """
+
+    def __init__(self, store, max_delay=0.005, max_rows=500):
+        self.store = store
+        self.writers = [GroupCommitWriter(path, max_delay=max_delay, max_rows=max_rows) for path in store.paths]
+
+    def start(self):
+        for writer in self.writers:
+            writer.start()
+
+    def stop(self):
+        for writer in self.writers:
+            writer.stop()
+
+    async def submit(self, reminder):
+        """
+        Сохраняет напоминание писателем его шарда.
+
+        Возвращает:
+            int: Глобальный ID сохраненного напоминания.
+        """
+        shard = self.store.shard_for_phone(reminder["phone_number"])
+        local_id = await self.writers[shard].submit(reminder)
+        return self.store.global_id(local_id, shard)
+
+    def stats(self):
+        """
+        Возвращает настройки групповой фиксации и длину очередей всех шардов.
+        """
+        stats = [writer.stats() for writer in self.writers]
+        return {**stats[0], "queued": sum(item["queued"] for item in stats)}
+
+
+class ShardedDispatcher:
+    """
+    Диспетчеры отправки по одному на шард с общим обработчиком доставки.
+
+    Обработчик `deliver` получает напоминания с глобальными ID, и результат отправки
+    сообщается методом `complete` также по глобальному ID.
+
+    Ограничения `max_inflight` и `claim_batch` заданы на процесс и делятся между
+    диспетчерами шардов поровну, поэтому процесс в целом захватывает не больше
+    `max_inflight` напоминаний при любом количестве шардов.
+
+    Атрибуты:
+        store (ShardedStore): Хранилище шардов.
+        dispatchers (list): Диспетчеры `Dispatcher` шардов.
+    """
+
+    def __init__(self, store, deliver, max_inflight=1000, claim_batch=200, **options):
+        self.store = store
+        self.deliver = deliver
+        self.dispatchers = [
+            Dispatcher(path, deliver=self._deliver_from(shard), max_inflight=max(1, max_inflight // store.count),
+                       claim_batch=max(1, claim_batch // store.count), **options)
+            for shard, path in enumerate(store.paths)
+        ]
+
+    def _deliver_from(self, shard):
+        def deliver(reminder):
+            self.deliver(self.store.to_global(reminder, shard))
+        return deliver
+
+    def _local(self, reminder):
+        return {**reminder, "id": self.store.local_id(reminder["id"])}
+
+    def start(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+
+    def stop(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.stop()
+
+    def flush(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.flush()
+
+    def notify(self, reminder):
+        self.dispatchers[self.store.shard_for_id(reminder["id"])].notify(self._local(reminder))
+
+    def notify_many(self, reminders):
+        groups = {}
+        for reminder in reminders:
+            groups.setdefault(self.store.shard_for_id(reminder["id"]), []).append(self._local(reminder))
+        for shard, group in groups.items():
+            self.dispatchers[shard].notify_many(group)
+
+    def complete(self, reminder_id, sent):
+        self.dispatchers[self.store.shard_for_id(reminder_id)].complete(self.store.local_id(reminder_id), sent)
+
+    def cancel(self, reminder_ids):
+        groups = {}
+        for reminder_id in reminder_ids:
+            groups.setdefault(self.store.shard_for_id(reminder_id), []).append(self.store.local_id(reminder_id))
+        for shard, local_ids in groups.items():
+            self.dispatchers[shard].cancel(local_ids)
+
+    def prepare(self, message):
+        """
+        Убирает из сообщения с глобальными ID напоминания, удаленные или захваченные другим
+        процессом после захвата (см. `Dispatcher.prepare`).
+
+        Возвращает:
+            dict | None: Сообщение для отправки или None, если не осталось ни одного напоминания.
+        """
+        groups = {}
+        for reminder_id in message.get("ids", [message["id"]]):
+            groups.setdefault(self.store.shard_for_id(reminder_id), []).append(self.store.local_id(reminder_id))
+        cancelled = set()
+        for shard, local_ids in groups.items():
+            cancelled.update(self.store.global_id(local_id, shard)
+                             for local_id in self.dispatchers[shard].cancelled_ids(local_ids))
+        return without_reminders(message, cancelled)
+
+    def stats(self):
+        """
+        Возвращает состояние очередей диспетчеров всех шардов.
+        """
+        stats = [dispatcher.stats() for dispatcher in self.dispatchers]
+        next_due = [item["next_due_at"] for item in stats if item["next_due_at"] is not None]
+        return {
+            "due_times": sum(item["due_times"] for item in stats),
+            "inflight": sum(item["inflight"] for item in stats),
+            "next_due_at": min(next_due) if next_due else None,
+        }
+
+    def due_count(self):
+        """
+        Возвращает количество неотправленных напоминаний в окнах диспетчеров всех шардов.
+        """
+        return sum(dispatcher.due_count() for dispatcher in self.dispatchers)
+
+    def message_cache_stats(self):
+        """
+        Возвращает счетчики кэшей отрисованных текстов, суммированные по шардам.
+        """
+        stats = [dispatcher.renderer.stats() for dispatcher in self.dispatchers]
+        return {key: sum(item[key] for item in stats) for key in stats[0]}
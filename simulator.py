@@ -0,0 +1,395 @@
+"""
+Модуль `simulator.py` содержит симулятор отправки напоминаний в виртуальном времени.
+
+Основные классы:
+- `VirtualClock`: Управляемые часы, которые подставляются в диспетчер вместо `time.time`.
+- `FakeTwilio`: Модель Twilio и конвейера доставки в виртуальном времени с задержками и ошибками.
+
+Основные функции:
+- `generate_load(options, start, rng)`: Генерирует времена и номера телефонов напоминаний для формы нагрузки.
+- `simulate(options)`: Выполняет симуляцию и возвращает отчет.
+
+Описание:
+    Симулятор проверяет поведение диспетчера на больших объемах (например, 1 млн напоминаний
+    на 09:00:00) за секунды, без ожидания реального времени. База данных заполняется
+    напоминаниями заданной формы нагрузки (`--shape`):
+    - `uniform`: равномерно в течение `--duration` секунд;
+    - `spike`: все напоминания на одну секунду начала часа;
+    - `burst`: серии по `--burst-size` напоминаний одного номера в пределах `--burst-spread` секунд.
+
+    Затем настоящий `Dispatcher` работает с этой базой, а его часы (`clock`) заменяются
+    на `VirtualClock`. Симулятор вызывает `Dispatcher.run_once` и переводит часы сразу
+    на следующее событие: время, которое вернул диспетчер, или ответ `FakeTwilio`.
+    Ответы, пришедшие в пределах `--tick` секунд, обрабатываются диспетчером за один цикл,
+    как при пробуждении его потока после нескольких вызовов `complete`.
+    `FakeTwilio` повторяет поведение `DeliveryPipeline` в виртуальном времени: не больше
+    `--concurrency` одновременных отправок, скорость `--rate` сообщений в секунду с запасом
+    `--burst`, задержка ответа `--latency` с разбросом `--jitter` и доля ошибок `--error-rate`
+    с повторами и экспоненциальной задержкой (конвейер доставки работает в реальном времени
+    asyncio, поэтому в симуляции используется его модель).
+
+    Отчет содержит распределение задержки передачи на отправку (`dispatch_lag`) и доставки
+    (`delivery_lag`) относительно времени напоминания, скорость отправки в виртуальном
+    времени, пиковую память Python-объектов по `tracemalloc` (без кэша страниц SQLite)
+    и скорость самой симуляции. Для объединенного сообщения задержка всех вошедших
+    напоминаний считается от времени самого раннего из них. Параметры диспетчера
+    (`--window`, `--claim-batch`, `--max-inflight`, `--coalesce-window` и другие) позволяют
+    сравнивать стратегии планирования на одной и той же нагрузке.
+
+Пример использования:
+    >>> python simulator.py --shape spike --count 1000000 --rate 80 --concurrency 50
+    >>> python simulator.py --shape burst --count 100000 --coalesce-window 60 --output sim.json
+"""
+
+import argparse
+import datetime
+import heapq
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from array import array
+from collections import deque
+
+from benchmark import percentile
+from database import create_database, format_timestamp, save_reminders
+from dispatcher import Dispatcher
+
+
+class VirtualClock:
+    """
+    Управляемые часы в секундах эпохи.
+
+    Атрибуты:
+        now (float): Текущее виртуальное время.
+    """
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance_to(self, moment):
+        """
+        Переводит часы вперед на момент `moment` (назад часы не переводятся).
+        """
+        self.now = max(self.now, moment)
+
+
+class FakeTwilio:
+    """
+    Модель Twilio и конвейера доставки в виртуальном времени.
+
+    Атрибуты:
+        clock (VirtualClock): Виртуальные часы.
+        on_done (callable): Обратный вызов `on_done(message, sent)` по завершении доставки.
+        concurrency (int): Максимальное количество одновременных отправок.
+        rate (float): Допустимое количество запросов в секунду.
+        burst (float | None): Запас запросов для кратковременных всплесков.
+        latency (float): Средняя задержка ответа в секундах.
+        jitter (float): Стандартное отклонение задержки ответа в секундах.
+        error_rate (float): Доля ответов с повторяемой ошибкой (429/5xx).
+        max_retries (int): Максимальное количество повторов одного сообщения.
+        backoff_base (float): Базовая задержка экспоненциального повтора в секундах.
+        backoff_max (float): Максимальная задержка между повторами в секундах.
+        delivery_lags (array): Задержки доставки напоминаний относительно их времени в секундах.
+    """
+
+    def __init__(self, clock, on_done, concurrency=50, rate=80.0, burst=None, latency=0.2, jitter=0.0,
+                 error_rate=0.0, max_retries=5, backoff_base=0.5, backoff_max=30.0, seed=1):
+        self.clock = clock
+        self.on_done = on_done
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.delivery_lags = array("d")
+        self.requests = 0
+        self.errors = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_done_at = None
+
+        self._random = random.Random(seed)
+        self._events = []
+        self._sequence = 0
+        self._waiting = deque()
+        self._free = concurrency
+        # Теоретическое время следующего запроса (token bucket в форме GCRA)
+        self._next_request = 0.0
+
+    def submit(self, message):
+        """
+        Принимает сообщение на отправку в текущий момент виртуального времени.
+        """
+        self._waiting.append(message)
+        self._start(self.clock())
+
+    def next_event_time(self):
+        """
+        Возвращает время ближайшего события отправки или None.
+        """
+        return self._events[0][0] if self._events else None
+
+    def run_until(self, until):
+        """
+        Обрабатывает события отправки не позже момента `until`.
+        """
+        while self._events and self._events[0][0] <= until:
+            moment, _, kind, message, attempt = heapq.heappop(self._events)
+            if kind == "request":
+                # Токены выдаются в порядке очереди, как под блокировкой `TokenBucket.acquire`
+                started = max(moment, self._next_request - (self.burst - 1) / self.rate)
+                self._next_request = max(self._next_request, started) + 1 / self.rate
+                self.requests += 1
+                self._push(started + self._response_time(), "response", message, attempt)
+            elif self._random.random() >= self.error_rate:
+                self._finish(moment, message, True)
+            else:
+                self.errors += 1
+                if attempt == self.max_retries:
+                    self._finish(moment, message, False)
+                    continue
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * self._random.uniform(0.5, 1.0)
+                self._push(moment + delay, "request", message, attempt + 1)
+
+    def _push(self, moment, kind, message, attempt):
+        self._sequence += 1
+        heapq.heappush(self._events, (moment, self._sequence, kind, message, attempt))
+
+    def _response_time(self):
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self._random.gauss(self.latency, self.jitter))
+
+    def _start(self, moment):
+        while self._free and self._waiting:
+            self._free -= 1
+            self._push(moment, "request", self._waiting.popleft(), 0)
+
+    def _finish(self, moment, message, sent):
+        self._free += 1
+        ids = message.get("ids", [message["id"]])
+        if sent:
+            self.sent += 1
+            self.delivery_lags.extend([moment - message["due_at"]] * len(ids))
+        else:
+            self.failed += 1
+        self.last_done_at = moment
+        self.on_done(message, sent)
+        self._start(moment)
+
+
+def generate_load(options, start, rng):
+    """
+    Генерирует напоминания формы нагрузки `options.shape`.
+
+    Параметры:
+        options: Параметры командной строки (`shape`, `count`, `phones`, `duration`,
+            `burst_size`, `burst_spread`).
+        start (int): Время начала нагрузки в секундах эпохи.
+        rng (random.Random): Генератор случайных чисел.
+
+    Возвращает:
+        Генератор пар `(phone_number, due_at)`.
+    """
+    numbers = [f"+7900{index:07d}" for index in range(options.phones)]
+    if options.shape == "uniform":
+        for index in range(options.count):
+            yield numbers[index % options.phones], start + int(rng.random() * options.duration)
+    elif options.shape == "spike":
+        for index in range(options.count):
+            yield numbers[index % options.phones], start
+    elif options.shape == "burst":
+        produced = 0
+        while produced < options.count:
+            phone_number = rng.choice(numbers)
+            burst_start = start + int(rng.random() * options.duration)
+            for _ in range(min(options.burst_size, options.count - produced)):
+                yield phone_number, burst_start + int(rng.random() * options.burst_spread)
+                produced += 1
+    else:
+        raise ValueError(f"Неизвестная форма нагрузки: {options.shape}")
+
+
+def seed_load(path, options, start):
+    """
+    Заполняет базу напоминаниями формы нагрузки.
+
+    Возвращает:
+        int: Время самого позднего напоминания в секундах эпохи.
+    """
+    rng = random.Random(options.seed)
+    conn = create_database(path)
+    chunk = []
+    last_due = start
+    for index, (phone_number, due_at) in enumerate(generate_load(options, start, rng)):
+        last_due = max(last_due, due_at)
+        if options.template:
+            reminder = {"reminder_text": "Здравствуйте, $name! Напоминание $number",
+                        "params": {"name": phone_number, "number": str(index)}}
+        else:
+            reminder = {"reminder_text": "Напоминание"}
+        chunk.append({**reminder, "phone_number": phone_number, "reminder_time": format_timestamp(due_at),
+                      "due_at": due_at})
+        if len(chunk) == 10000:
+            save_reminders(conn, chunk)
+            chunk = []
+    save_reminders(conn, chunk)
+    conn.close()
+    return last_due
+
+
+def summarize_lags(lags):
+    """
+    Сводит задержки в перцентили (в секундах).
+    """
+    lags = sorted(lags)
+    if not lags:
+        return None
+    return {
+        "mean_s": round(sum(lags) / len(lags), 3),
+        "p50_s": round(percentile(lags, 0.50), 3),
+        "p95_s": round(percentile(lags, 0.95), 3),
+        "p99_s": round(percentile(lags, 0.99), 3),
+        "max_s": round(lags[-1], 3),
+    }
+
+
+def simulate(options):
+    """
+    Заполняет базу, выполняет отправку в виртуальном времени и возвращает отчет.
+
+    Параметры:
+        options: Параметры командной строки.
+
+    Возвращает:
+        dict: Отчет симуляции.
+    """
+    start = int(datetime.datetime.strptime(options.start, "%Y-%m-%d %H:%M:%S").timestamp())
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "simulation.db")
+        seed_started = time.perf_counter()
+        last_due = seed_load(path, options, start)
+        seed_elapsed = time.perf_counter() - seed_started
+
+        clock = VirtualClock(start - options.lead)
+        dispatch_lags = array("d")
+        completed = 0
+
+        def deliver(message):
+            ids = message.get("ids", [message["id"]])
+            dispatch_lags.extend([clock.now - message["due_at"]] * len(ids))
+            twilio.submit(message)
+
+        def on_done(message, sent):
+            nonlocal completed
+            for reminder_id in message.get("ids", [message["id"]]):
+                dispatcher.complete(reminder_id, sent)
+                completed += 1
+
+        tracemalloc.start()
+        dispatcher = Dispatcher(
+            path, deliver=deliver, window=options.window, batch_size=options.batch_size, clock=clock,
+            coalesce_window=options.coalesce_window, worker_id="simulator", lease=options.lease,
+            claim_batch=options.claim_batch, max_inflight=options.max_inflight)
+        twilio = FakeTwilio(
+            clock, on_done, concurrency=options.concurrency, rate=options.rate, burst=options.burst,
+            latency=options.latency, jitter=options.jitter, error_rate=options.error_rate,
+            max_retries=options.max_retries, seed=options.seed)
+
+        deadline = last_due + options.timeout
+        cycles = 0
+        wall_started = time.perf_counter()
+        while completed < options.count and clock.now <= deadline:
+            delay = dispatcher.run_once()
+            cycles += 1
+            twilio.run_until(clock.now)
+            next_time = clock.now + delay
+            event_time = twilio.next_event_time()
+            if event_time is not None:
+                next_time = min(next_time, max(event_time, clock.now + options.tick))
+            clock.advance_to(next_time)
+            twilio.run_until(clock.now)
+        dispatcher.flush()
+        wall_elapsed = time.perf_counter() - wall_started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    sending_time = (twilio.last_done_at - start) if twilio.last_done_at is not None else None
+    return {
+        "shape": options.shape,
+        "reminders": options.count,
+        "completed": completed,
+        "messages_sent": twilio.sent,
+        "messages_failed": twilio.failed,
+        "twilio_requests": twilio.requests,
+        "twilio_errors": twilio.errors,
+        "dispatcher_cycles": cycles,
+        "virtual_elapsed_s": round(clock.now - start, 3),
+        "sends_per_s": round(twilio.sent / sending_time, 1) if sending_time else None,
+        "dispatch_lag": summarize_lags(dispatch_lags),
+        "delivery_lag": summarize_lags(twilio.delivery_lags),
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "seed_s": round(seed_elapsed, 3),
+        "wall_s": round(wall_elapsed, 3),
+        "simulated_reminders_per_wall_s": round(completed / wall_elapsed, 1) if wall_elapsed else None,
+    }
+
+
+def parse_args(argv=None):
+    """
+    Разбирает параметры командной строки.
+    """
+    parser = argparse.ArgumentParser(description="Симуляция отправки напоминаний в виртуальном времени")
+    parser.add_argument("--shape", choices=("uniform", "spike", "burst"), default="spike", help="Форма нагрузки")
+    parser.add_argument("--count", type=int, default=100000, help="Количество напоминаний")
+    parser.add_argument("--phones", type=int, default=10000, help="Количество номеров телефонов")
+    parser.add_argument("--start", default="2030-01-01 09:00:00", help="Время начала нагрузки (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--duration", type=int, default=3600, help="Длительность нагрузки uniform/burst (с)")
+    parser.add_argument("--burst-size", type=int, default=10, help="Напоминаний в одной серии burst")
+    parser.add_argument("--burst-spread", type=int, default=30, help="Разброс времени серии burst (с)")
+    parser.add_argument("--template", action="store_true", help="Шаблон текста с параметрами вместо общего текста")
+    parser.add_argument("--lead", type=float, default=60, help="За сколько секунд до начала нагрузки запускается диспетчер")
+    parser.add_argument("--tick", type=float, default=0.05, help="Разрешение виртуального времени для ответов (с)")
+    parser.add_argument("--timeout", type=float, default=86400, help="Предел виртуального времени после нагрузки (с)")
+    parser.add_argument("--window", type=float, default=300, help="Окно диспетчера (с)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Значений времени за один запрос дозаполнения окна")
+    parser.add_argument("--claim-batch", type=int, default=200, help="Напоминаний, захватываемых одним запросом")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="Захваченных, но не отправленных напоминаний")
+    parser.add_argument("--lease", type=float, default=60, help="Срок аренды захваченных напоминаний (с)")
+    parser.add_argument("--coalesce-window", type=float, default=0, help="Окно объединения напоминаний (с)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных отправок")
+    parser.add_argument("--rate", type=float, default=80, help="Сообщений в секунду")
+    parser.add_argument("--burst", type=float, help="Запас сообщений для всплесков (по умолчанию равен --rate)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Средняя задержка ответа Twilio (с)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Разброс задержки ответа Twilio (с)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов Twilio с повторяемой ошибкой")
+    parser.add_argument("--max-retries", type=int, default=5, help="Повторов одного сообщения")
+    parser.add_argument("--seed", type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--output", help="Файл для сохранения отчета в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Точка входа: выполняет симуляцию и выводит отчет.
+    """
+    options = parse_args(argv)
+    report = simulate(options)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()